@@ -0,0 +1,184 @@
+# Contrôle d'admission de /search : débit par utilisateur (seau à jetons) + appels au modèle simultanés bornés
+import os
+import random
+import threading
+import time
+
+# Algorithme GCRA, équivalent à un seau à jetons de `burst` jetons rechargé d'un jeton toutes les
+# `interval` secondes : on ne stocke qu'un instant théorique d'arrivée (tat) par clé, ce qui tient
+# en une seule instruction atomique côté PostgreSQL ou Redis.
+
+REDIS_TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local new_tat = tat + interval
+if new_tat - now > window then
+    return tostring(new_tat - window - now)
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return '0'
+"""
+
+
+class AdmissionRejected(Exception):
+    """Requête refusée (429) : `reason` pour les métriques, `retry_after` en secondes"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason} (retry after {retry_after:.1f}s)")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class MemoryRateLimitStore:
+    """Compteurs du worker courant : la limite est multipliée par le nombre de workers"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, interval, window):
+        """0 si la requête passe, sinon le délai (s) avant qu'elle puisse passer"""
+        now = time.monotonic()
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            if tat + interval - now > window:
+                return tat + interval - window - now
+            self._tats[key] = tat + interval
+            if len(self._tats) > self.max_keys:
+                self._tats = {k: v for k, v in self._tats.items() if v > now}
+        return 0.0
+
+
+class PostgresRateLimitStore:
+    """Compteurs partagés dans public.rate_limits (un aller-retour par requête admise)"""
+
+    def __init__(self, get_db, cleanup_probability=0.001):
+        self.get_db = get_db
+        self.cleanup_probability = cleanup_probability
+
+    def take(self, key, interval, window):
+        params = {"key": key, "interval": interval, "window": window}
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT INTO public.rate_limits AS r (key, tat)
+                   VALUES (%(key)s, EXTRACT(EPOCH FROM clock_timestamp()) + %(interval)s)
+                   ON CONFLICT (key) DO UPDATE
+                   SET tat = GREATEST(r.tat, EXTRACT(EPOCH FROM clock_timestamp())) + %(interval)s
+                   WHERE GREATEST(r.tat, EXTRACT(EPOCH FROM clock_timestamp())) + %(interval)s
+                         - EXTRACT(EPOCH FROM clock_timestamp()) <= %(window)s
+                   RETURNING tat""",
+                params
+            )
+            admitted = cursor.fetchone() is not None
+            retry_after = 0.0
+            if not admitted:
+                cursor.execute(
+                    """SELECT tat + %(interval)s - %(window)s - EXTRACT(EPOCH FROM clock_timestamp())
+                       FROM public.rate_limits WHERE key = %(key)s""",
+                    params
+                )
+                row = cursor.fetchone()
+                retry_after = max(float(row[0]), 0.0) if row else interval
+            elif random.random() < self.cleanup_probability:
+                cursor.execute("DELETE FROM public.rate_limits WHERE tat < EXTRACT(EPOCH FROM clock_timestamp())")
+            cursor.close()
+        return retry_after
+
+
+class RedisRateLimitStore:
+    """Compteurs partagés dans Redis (script Lua atomique, clés expirées automatiquement)"""
+
+    def __init__(self, client, prefix="finker:ratelimit:"):
+        self.prefix = prefix
+        self._take = client.register_script(REDIS_TAKE_SCRIPT)
+
+    def take(self, key, interval, window):
+        return float(self._take(keys=[self.prefix + key], args=[interval, window]))
+
+
+class AdmissionControl:
+    """Débit par utilisateur (store partagé) puis place parmi les appels au modèle en cours (par worker)
+
+    Au-delà de `max_in_flight` appels simultanés, jusqu'à `max_queue` requêtes attendent une
+    place au plus `queue_timeout` secondes ; les suivantes sont refusées immédiatement.
+    """
+
+    def __init__(self, store, rate_per_minute=20, burst=5, max_in_flight=0, max_queue=0, queue_timeout=10.0):
+        self.store = store
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0
+        self.window = self.interval * max(burst, 1)
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+
+    @classmethod
+    def from_env(cls, get_db):
+        backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+        if backend == "memory":
+            store = MemoryRateLimitStore()
+        elif backend == "postgres":
+            store = PostgresRateLimitStore(get_db)
+        elif backend == "redis":
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package (pip install redis)")
+            store = RedisRateLimitStore(redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+        else:
+            raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+        return cls(
+            store,
+            rate_per_minute=float(os.getenv("SEARCH_RATE_LIMIT_PER_MINUTE", "20")),
+            burst=int(os.getenv("SEARCH_RATE_LIMIT_BURST", "5")),
+            max_in_flight=int(os.getenv("MODEL_MAX_IN_FLIGHT", "50")),
+            max_queue=int(os.getenv("MODEL_QUEUE_SIZE", "50")),
+            queue_timeout=float(os.getenv("MODEL_QUEUE_TIMEOUT", "10")),
+        )
+
+    def check_rate(self, key):
+        """Consommer un jeton pour `key` ou lever AdmissionRejected (limite désactivée si débit = 0)"""
+        if not self.interval:
+            return
+        retry_after = self.store.take(key, self.interval, self.window)
+        if retry_after > 0:
+            raise AdmissionRejected("rate_limited", retry_after)
+
+    def acquire(self):
+        """Réserver une place parmi les appels au modèle ; retourne le temps passé en file d'attente (0 sans attente)"""
+        if self.max_in_flight <= 0:
+            return 0.0
+        with self._cond:
+            if self._in_flight < self.max_in_flight:
+                self._in_flight += 1
+                return 0.0
+            if self._waiting >= self.max_queue:
+                raise AdmissionRejected("queue_full", self.queue_timeout)
+            self._waiting += 1
+            started = time.monotonic()
+            try:
+                admitted = self._cond.wait_for(lambda: self._in_flight < self.max_in_flight, self.queue_timeout)
+            finally:
+                self._waiting -= 1
+            if not admitted:
+                raise AdmissionRejected("queue_timeout", self.queue_timeout)
+            self._in_flight += 1
+            return time.monotonic() - started
+
+    def release(self):
+        if self.max_in_flight <= 0:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {"in_flight": self._in_flight, "waiting": self._waiting}
@@ -0,0 +1,362 @@
+# Banc de charge : base PostgreSQL locale peuplée, faux Gemini, utilisateurs concurrents par scénario
+#
+#   python -m bench.run --scenarios login,dashboard,chat --concurrency 20 --duration 30
+#
+# Par défaut l'application tourne dans ce processus (serveur werkzeug multi-thread) avec
+# MODEL_BACKEND=bench.stub_model:StubClient, RESPONSE_CACHE=0, LOG_EVENTS=0 et sans limite de débit par utilisateur ;
+# --url vise un serveur déjà lancé (gunicorn, staging...). Les allers-retours SQL par requête sont lus
+# sur /metrics (avec METRICS_TOKEN en Bearer s'il est défini) : avec plusieurs workers gunicorn et sans
+# METRICS_DIR, ils ne couvrent que le worker qui répond au scrape.
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+import psycopg2
+import requests
+from psycopg2.extras import execute_values
+
+BENCH_PREFIX = "bench_"
+BENCH_PASSWORD = "bench-password"
+
+QUESTIONS = [
+    "C'est quoi une régression logistique ?",
+    "Explique-moi la descente de gradient avec une analogie.",
+    "Quelle différence entre apprentissage supervisé et non supervisé ?",
+    "Comment fonctionne l'attention dans un transformeur ?",
+    "Pourquoi normaliser les données avant l'entraînement ?",
+]
+
+
+def seed(database_url, users, conversations, messages, reset=False):
+    """Créer les utilisateurs bench_* avec leurs conversations (une seule fois, sauf --reset)"""
+    from migrate import apply_migrations
+    from passwords import PasswordHasher
+
+    conn = psycopg2.connect(database_url)
+    try:
+        apply_migrations(conn)
+        cursor = conn.cursor()
+        if reset:
+            cursor.execute("DELETE FROM public.users WHERE username LIKE %s", (BENCH_PREFIX + "%",))
+        # Mêmes paramètres que le serveur (PASSWORD_HASH_METHOD) : le scénario login mesure leur coût réel
+        password = PasswordHasher.from_env().hash(BENCH_PASSWORD)
+        execute_values(
+            cursor,
+            "INSERT INTO public.users (username, password) VALUES %s ON CONFLICT (username) DO NOTHING",
+            [(f"{BENCH_PREFIX}{i}", password) for i in range(users)],
+        )
+        cursor.execute(
+            """SELECT u.id FROM public.users u
+               WHERE u.username LIKE %s
+                 AND NOT EXISTS (SELECT 1 FROM public.conversations c WHERE c.user_id = u.id)""",
+            (BENCH_PREFIX + "%",)
+        )
+        empty_users = [row[0] for row in cursor.fetchall()]
+        for user_id in empty_users:
+            conversation_ids = [row[0] for row in execute_values(
+                cursor,
+                "INSERT INTO public.conversations (user_id, title) VALUES %s RETURNING id",
+                [(user_id, f"Conversation {n}") for n in range(conversations)],
+                fetch=True,
+            )]
+            rows = []
+            for conversation_id in conversation_ids:
+                for n in range(messages):
+                    role = "user" if n % 2 == 0 else "assistant"
+                    content = random.choice(QUESTIONS) if role == "user" else "Réponse de référence. " * 40
+                    rows.append((conversation_id, user_id, role, content))
+            execute_values(
+                cursor,
+                "INSERT INTO public.conversations_history (conversation_id, user_id, role, content) VALUES %s",
+                rows,
+                page_size=1000,
+            )
+        conn.commit()
+        cursor.close()
+        return len(empty_users)
+    finally:
+        conn.close()
+
+
+def start_local_server(port):
+    """Lancer l'application dans ce processus, avec le faux modèle"""
+    os.environ.setdefault("MODEL_BACKEND", "bench.stub_model:StubClient")
+    os.environ.setdefault("RESPONSE_CACHE", "0")
+    os.environ.setdefault("SEARCH_RATE_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    # Logs JSON de l'application sur la même sortie que le rapport : coupés sauf LOG_EVENTS=1
+    os.environ.setdefault("LOG_EVENTS", "0")
+    from werkzeug.serving import make_server
+
+    from main import app
+
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def scrape_round_trips(base_url):
+    """{route: (somme, nombre)} de l'histogramme finker_db_round_trips"""
+    totals = {}
+    try:
+        headers = {"Authorization": f"Bearer {os.environ['METRICS_TOKEN']}"} if os.getenv("METRICS_TOKEN") else {}
+        text = requests.get(base_url + "/metrics", headers=headers, timeout=10).text
+    except requests.RequestException:
+        return totals
+    for match in re.finditer(r'^finker_db_round_trips_(sum|count)\{route="([^"]*)"\} (\S+)$', text, re.M):
+        kind, route, value = match.groups()
+        total = totals.setdefault(route, [0.0, 0])
+        if kind == "sum":
+            total[0] = float(value)
+        else:
+            total[1] = int(float(value))
+    return totals
+
+
+class Recorder:
+    """Latences et erreurs par route, partagées entre les threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # route -> {"latencies": [], "errors": 0, "ttft": []}
+
+    def record(self, route, latency, ok=True, ttft=None):
+        with self._lock:
+            sample = self.samples.setdefault(route, {"latencies": [], "errors": 0, "ttft": []})
+            sample["latencies"].append(latency)
+            if not ok:
+                sample["errors"] += 1
+            if ttft is not None:
+                sample["ttft"].append(ttft)
+
+
+def _timed(recorder, route, fn):
+    start = time.perf_counter()
+    try:
+        response = fn()
+        ok = response.status_code < 400
+    except requests.RequestException:
+        ok = False
+    recorder.record(route, time.perf_counter() - start, ok)
+
+
+def login(http, base_url, username):
+    return http.post(base_url + "/login", data={"username": username, "password": BENCH_PASSWORD},
+                     allow_redirects=False, timeout=30)
+
+
+def run_login(http, base_url, state, recorder):
+    http.cookies.clear()
+    _timed(recorder, "/login", lambda: login(http, base_url, state["username"]))
+
+
+def run_dashboard(http, base_url, state, recorder):
+    start = time.perf_counter()
+    try:
+        response = http.get(base_url + "/api/conversations", timeout=30)
+        conversations = response.json() if response.ok else []
+        ok = response.ok
+    except (requests.RequestException, ValueError):
+        conversations, ok = [], False
+    recorder.record("/api/conversations", time.perf_counter() - start, ok)
+    conversation_id = random.choice(conversations)["id"] if conversations else None
+    _timed(recorder, "/", lambda: http.get(base_url + "/", params={"conversation_id": conversation_id}, timeout=30))
+    if conversation_id:
+        _timed(recorder, "/api/conversations/<int:conversation_id>",
+               lambda: http.get(f"{base_url}/api/conversations/{conversation_id}", timeout=30))
+
+
+def run_chat(http, base_url, state, recorder):
+    """Un tour en streaming NDJSON dans une conversation existante : temps jusqu'au premier morceau et durée totale"""
+    if "conversation_id" not in state:
+        try:
+            conversations = http.get(base_url + "/api/conversations", timeout=30).json()
+        except (requests.RequestException, ValueError):
+            conversations = []
+        state["conversation_id"] = random.choice(conversations)["id"] if conversations else None
+    payload = {"message": random.choice(QUESTIONS), "conversation_id": state["conversation_id"], "stream": True}
+    start = time.perf_counter()
+    ttft = None
+    ok = False
+    try:
+        with http.post(base_url + "/search", json=payload, stream=True, timeout=120) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "chunk" and ttft is None:
+                    ttft = time.perf_counter() - start
+                elif event["type"] == "start":
+                    state["conversation_id"] = event["conversation_id"]
+                elif event["type"] == "done":
+                    ok = True
+                elif event["type"] == "error":
+                    break
+    except requests.RequestException:
+        pass
+    recorder.record("/search", time.perf_counter() - start, ok, ttft)
+
+
+SCENARIOS = {"login": run_login, "dashboard": run_dashboard, "chat": run_chat}
+
+
+def virtual_user(base_url, username, scenario, deadline, recorder):
+    http = requests.Session()
+    state = {"username": username}
+    if scenario != "login" and login(http, base_url, username).status_code != 302:
+        recorder.record("/login", 0.0, ok=False)
+        return
+    while time.monotonic() < deadline:
+        SCENARIOS[scenario](http, base_url, state, recorder)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_scenario(base_url, scenario, concurrency, duration, users):
+    recorder = Recorder()
+    before = scrape_round_trips(base_url)
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=virtual_user,
+                         args=(base_url, f"{BENCH_PREFIX}{i % users}", scenario, deadline, recorder))
+        for i in range(concurrency)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    after = scrape_round_trips(base_url)
+
+    report = []
+    for route, sample in sorted(recorder.samples.items()):
+        latencies = sample["latencies"]
+        row = {
+            "scenario": scenario,
+            "route": route,
+            "requests": len(latencies),
+            "errors": sample["errors"],
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": _ms(percentile(latencies, 50)),
+            "p95_ms": _ms(percentile(latencies, 95)),
+            "p99_ms": _ms(percentile(latencies, 99)),
+            "ttft_p50_ms": _ms(percentile(sample["ttft"], 50)),
+            "ttft_p95_ms": _ms(percentile(sample["ttft"], 95)),
+            "db_round_trips": None,
+        }
+        if route in after:
+            total, count = after[route]
+            prev_total, prev_count = before.get(route, (0.0, 0))
+            if count > prev_count:
+                row["db_round_trips"] = round((total - prev_total) / (count - prev_count), 2)
+        report.append(row)
+    return report
+
+
+def login_capacity(base_url, target_p95_ms, duration, users, max_concurrency=256):
+    """Débit de logins le plus élevé tenant le p95 cible : concurrence doublée jusqu'à dépasser la cible"""
+    best = None
+    concurrency = 1
+    while concurrency <= max_concurrency:
+        rows = [row for row in run_scenario(base_url, "login", concurrency, duration, users) if row["route"] == "/login"]
+        if not rows:
+            break
+        row = dict(rows[0], scenario="login_capacity", concurrency=concurrency)
+        print(f"  login x{concurrency}: {row['rps']} req/s, p95 {row['p95_ms']} ms", file=sys.stderr)
+        if row["errors"] or row["p95_ms"] > target_p95_ms:
+            break
+        best = row
+        concurrency *= 2
+    return best
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def print_report(rows):
+    columns = ["scenario", "route", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms",
+               "ttft_p50_ms", "ttft_p95_ms", "db_round_trips"]
+    cells = [[("-" if row[c] is None else str(row[c])) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) if cells else len(c) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge Finker")
+    parser.add_argument("--url", help="serveur déjà lancé (par défaut : application dans ce processus)")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--no-seed", action="store_true", help="ne pas peupler la base (serveur distant)")
+    parser.add_argument("--reset", action="store_true", help="recréer les utilisateurs bench_*")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--scenarios", default="login,dashboard,chat")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20.0, help="secondes par scénario")
+    parser.add_argument("--login-p95-ms", type=float,
+                        help="mesurer aussi le débit max de /login (logins/s) avec un p95 sous ce seuil")
+    parser.add_argument("--json", help="écrire le rapport dans ce fichier")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    if not args.no_seed:
+        if not args.database_url:
+            parser.error("DATABASE_URL (or --database-url) is required to seed the database")
+        seeded = seed(args.database_url, args.users, args.conversations, args.messages, reset=args.reset)
+        print(f"Seeded {seeded} bench user(s)", file=sys.stderr)
+
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        if args.database_url:
+            os.environ["DATABASE_URL"] = args.database_url
+        server, base_url = start_local_server(args.port)
+
+    rows = []
+    try:
+        for scenario in scenarios:
+            print(f"Running {scenario} ({args.concurrency} users, {args.duration:g}s)...", file=sys.stderr)
+            rows += run_scenario(base_url, scenario, args.concurrency, args.duration, args.users)
+        capacity = None
+        if args.login_p95_ms:
+            print(f"Searching login capacity at p95 <= {args.login_p95_ms:g} ms...", file=sys.stderr)
+            capacity = login_capacity(base_url, args.login_p95_ms, args.duration, args.users)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    print_report(rows)
+    if args.login_p95_ms:
+        if capacity is None:
+            print(f"\nLogin capacity: p95 above {args.login_p95_ms:g} ms even with a single user")
+        else:
+            print(f"\nLogin capacity: {capacity['rps']} logins/s at p95 {capacity['p95_ms']} ms "
+                  f"(concurrency {capacity['concurrency']}, target {args.login_p95_ms:g} ms)")
+            rows.append(capacity)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
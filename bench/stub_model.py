@@ -0,0 +1,114 @@
+# Faux client Gemini pour les benchmarks : même interface que genai.Client, latence et découpage configurables
+import hashlib
+import math
+import os
+import random
+import re
+import time
+
+from google.genai import errors, types
+
+LOREM = (
+    "Le **machine learning** consiste à apprendre une fonction à partir d'exemples plutôt qu'à la programmer. "
+    "Par exemple, pour reconnaître des chats, on montre au modèle des milliers d'images annotées.\n\n"
+    "```python\nfrom sklearn.linear_model import LogisticRegression\nmodel = LogisticRegression().fit(X, y)\n```\n\n"
+    "| Étape | Rôle |\n|---|---|\n| Entraînement | ajuster les poids |\n| Évaluation | mesurer l'erreur |\n\n"
+)
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+class _StubModels:
+    def __init__(self, first_chunk_latency, chunk_delay, chunks, chunk_size, failure_rate=0.0, failing_models=(),
+                 embed_latency=0.0):
+        self.first_chunk_latency = first_chunk_latency
+        self.embed_latency = embed_latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.failure_rate = failure_rate
+        self.failing_models = failing_models
+
+    def _maybe_fail(self, model):
+        """Simuler une surcharge du fournisseur (503) pour exercer nouveaux essais et repli"""
+        if model in self.failing_models or random.random() < self.failure_rate:
+            raise errors.ServerError(503, {"error": {"code": 503, "message": "stub overloaded", "status": "UNAVAILABLE"}})
+
+    def _response(self, text, prompt_tokens=0, output_tokens=0):
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part.from_text(text=text)]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+            ),
+        )
+
+    def _text(self, n):
+        text = LOREM * (n // len(LOREM) + 1)
+        return text[:n]
+
+    def generate_content_stream(self, model, contents, config=None):
+        """Comme l'API : un itérateur de GenerateContentResponse, le premier après `first_chunk_latency`"""
+        prompt_tokens = sum(len(part.text or "") for content in contents for part in content.parts) // 4
+        time.sleep(self.first_chunk_latency)
+        self._maybe_fail(model)
+        text = self._text(self.chunks * self.chunk_size)
+        for i in range(self.chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            piece = text[i * self.chunk_size:(i + 1) * self.chunk_size]
+            last = i == self.chunks - 1
+            yield self._response(piece, prompt_tokens if last else 0, len(text) // 4 if last else 0)
+
+    def generate_content(self, model, contents, config=None):
+        """Réponse complète (utilisée pour les résumés)"""
+        time.sleep(self.first_chunk_latency + self.chunk_delay * (self.chunks - 1))
+        self._maybe_fail(model)
+        return self._response(self._text(self.chunks * self.chunk_size))
+
+    def embed_content(self, model, contents, config=None):
+        """Embeddings locaux déterministes (sac de mots haché, normalisé) : des textes qui partagent
+        des mots sont proches, ce qui suffit à exercer la récupération sans appel réseau"""
+        time.sleep(self.embed_latency)
+        self._maybe_fail(model)
+        dimensions = (config.output_dimensionality if config else None) or 768
+        texts = [contents] if isinstance(contents, str) else contents
+        return types.EmbedContentResponse(
+            embeddings=[types.ContentEmbedding(values=stub_embedding(text, dimensions)) for text in texts]
+        )
+
+
+def stub_embedding(text, dimensions):
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class StubClient:
+    """MODEL_BACKEND=bench.stub_model:StubClient
+
+    STUB_FIRST_CHUNK_MS  latence avant le premier morceau (défaut: 300)
+    STUB_CHUNK_DELAY_MS  délai entre deux morceaux (défaut: 40)
+    STUB_CHUNKS          nombre de morceaux (défaut: 25)
+    STUB_CHUNK_SIZE      caractères par morceau (défaut: 80)
+    STUB_FAILURE_RATE    proportion d'appels en erreur 503 avant le premier morceau (défaut: 0)
+    STUB_FAILING_MODELS  modèles toujours en erreur 503, séparés par des virgules (défaut: aucun)
+    STUB_EMBED_MS        latence d'un appel d'embedding (défaut: 20)
+    """
+
+    def __init__(self, api_key=None, **kwargs):
+        self.models = _StubModels(
+            first_chunk_latency=_env_float("STUB_FIRST_CHUNK_MS", "300") / 1000,
+            chunk_delay=_env_float("STUB_CHUNK_DELAY_MS", "40") / 1000,
+            chunks=int(os.getenv("STUB_CHUNKS", "25")),
+            chunk_size=int(os.getenv("STUB_CHUNK_SIZE", "80")),
+            failure_rate=_env_float("STUB_FAILURE_RATE", "0"),
+            failing_models={m.strip() for m in os.getenv("STUB_FAILING_MODELS", "").split(",") if m.strip()},
+            embed_latency=_env_float("STUB_EMBED_MS", "20") / 1000,
+        )
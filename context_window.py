@@ -0,0 +1,75 @@
+# Fenêtre de contexte bornée : résumé glissant des anciens échanges + derniers messages verbatim
+import os
+
+
+def estimate_tokens(text):
+    """Estimation grossière (~4 caractères par token), suffisante pour tenir un budget"""
+    return len(text) // 4 + 4
+
+
+class ContextWindow:
+    """Choisir ce qui est envoyé au modèle à chaque tour, sous un budget de tokens
+
+    mode "recent" : résumé + le plus de messages récents possible ; mode "retrieval" : résumé +
+    échanges anciens pertinents (retrieval.py) + les `recent_messages` derniers messages.
+    """
+
+    def __init__(self, token_budget=8000, recent_messages=12, summary_batch=8, mode="recent"):
+        if mode not in ("recent", "retrieval"):
+            raise RuntimeError(f"Unknown CONTEXT_MODE: {mode}")
+        self.mode = mode
+        self.token_budget = token_budget
+        # Le tour courant (question + réponse) doit toujours rester hors du résumé
+        self.recent_messages = max(recent_messages, 2)
+        self.summary_batch = summary_batch
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000")),
+            recent_messages=int(os.getenv("CONTEXT_RECENT_MESSAGES", "12")),
+            summary_batch=int(os.getenv("CONTEXT_SUMMARY_BATCH", "8")),
+            mode=os.getenv("CONTEXT_MODE", "recent"),
+        )
+
+    def build(self, summary, history, retrieved=None):
+        """Résumé stocké + messages les plus récents qui tiennent dans le budget
+
+        Avec `retrieved` (échanges [question, réponse] par pertinence décroissante), seuls les
+        `recent_messages` derniers messages sont repris tels quels ; le reste du budget va aux
+        échanges retrouvés, présentés dans l'ordre chronologique.
+        """
+        used = estimate_tokens(summary) if summary else 0
+        selected = []
+        for msg in reversed(history if retrieved is None else history[-self.recent_messages:]):
+            cost = estimate_tokens(msg["content"])
+            if selected and used + cost > self.token_budget:
+                break
+            selected.append(msg)
+            used += cost
+        selected.reverse()
+        if retrieved:
+            excerpts = []
+            for turn in retrieved:
+                cost = sum(estimate_tokens(msg["content"]) for msg in turn)
+                if used + cost > self.token_budget:
+                    continue
+                excerpts.append(turn)
+                used += cost
+            if excerpts:
+                excerpts.sort(key=lambda turn: turn[0]["id"])
+                transcript = "\n\n".join(
+                    f"{'Utilisateur' if msg['role'] == 'user' else 'Finker'} : {msg['content']}"
+                    for turn in excerpts for msg in turn
+                )
+                selected.insert(0, {"role": "user", "content": f"Extraits pertinents de nos échanges précédents :\n{transcript}"})
+        if summary:
+            selected.insert(0, {"role": "user", "content": f"Résumé de nos échanges précédents :\n{summary}"})
+        return selected
+
+    def messages_to_summarize(self, history):
+        """Messages sortis de la fenêtre récente, à fondre dans le résumé (par lots)"""
+        aged = history[:-self.recent_messages]
+        if len(aged) < self.summary_batch:
+            return []
+        return aged
@@ -0,0 +1,306 @@
+# Pool de connexions PostgreSQL/Supabase (un pool par worker gunicorn)
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """Aucune connexion disponible dans le délai imparti"""
+
+
+# Compteur d'allers-retours SQL propre à chaque thread (donc à chaque requête)
+_local = threading.local()
+
+
+def reset_round_trips():
+    _local.round_trips = 0
+    _local.checkout_time = 0.0
+
+
+def round_trips():
+    """Nombre d'allers-retours SQL depuis le dernier `reset_round_trips()`"""
+    return getattr(_local, "round_trips", 0)
+
+
+def checkout_time():
+    """Temps passé à obtenir des connexions (attente + ouverture) depuis le dernier `reset_round_trips()`"""
+    return getattr(_local, "checkout_time", 0.0)
+
+
+def _count_round_trip(n=1):
+    _local.round_trips = getattr(_local, "round_trips", 0) + n
+
+
+_counting_cursors = {}
+
+
+def _counting_cursor(base):
+    """Sous-classe de `base` qui compte chaque execute() comme un aller-retour"""
+    cls = _counting_cursors.get(base)
+    if cls is None:
+        class CountingCursor(base):
+            def _count(self, n):
+                conn = self.connection
+                if not conn.autocommit and not conn._in_transaction():
+                    n += 1  # BEGIN implicite envoyé par psycopg2
+                _count_round_trip(n)
+
+            def execute(self, query, vars=None):
+                self._count(1)
+                return super().execute(query, vars)
+
+            def executemany(self, query, vars_list):
+                vars_list = list(vars_list)
+                self._count(len(vars_list))
+                return super().executemany(query, vars_list)
+
+            def copy_expert(self, sql, file, size=8192):
+                self._count(1)
+                return super().copy_expert(sql, file, size)
+
+        CountingCursor.__name__ = f"Counting{base.__name__}"
+        cls = _counting_cursors[base] = CountingCursor
+    return cls
+
+
+class CountingConnection(extensions.connection):
+    """Connexion qui compte les requêtes, BEGIN implicites et COMMIT/ROLLBACK envoyés au serveur"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor
+        kwargs["cursor_factory"] = _counting_cursor(base)
+        return super().cursor(*args, **kwargs)
+
+    def _in_transaction(self):
+        return self.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        if self._in_transaction():
+            _count_round_trip()
+        return super().commit()
+
+    def rollback(self):
+        if self._in_transaction():
+            _count_round_trip()
+        return super().rollback()
+
+
+class ConnectionPool:
+    """Pool de connexions thread-safe avec attente bornée, health checks et métriques"""
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30.0, health_check_interval=30.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # pile LIFO de (conn, dernier_usage) : on réutilise la connexion la plus chaude
+        self._size = 0   # connexions ouvertes (inactives + empruntées)
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=CountingConnection)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def prefill(self):
+        """Ouvrir les `minconn` connexions initiales"""
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            self.putconn(conn)
+
+    def _is_healthy(self, conn, last_used):
+        """Vérifier une connexion inactive avant de la prêter"""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Emprunter une connexion (attend au plus `timeout` secondes si le pool est plein)"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        conn = None
+        last_used = None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No connection available after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_time = time.monotonic() - start
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                self._close_quietly(conn)
+                with self._cond:
+                    self._discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        _local.checkout_time = getattr(_local, "checkout_time", 0.0) + time.monotonic() - start
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Rendre une connexion au pool (fermée si cassée ou si `discard`)"""
+        if not discard and not conn.closed:
+            if conn.autocommit:
+                conn.autocommit = False
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._size -= 1
+                self._discarded += 1
+                self._cond.notify()
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self, autocommit=False):
+        """Emprunter une connexion le temps d'un bloc `with` (commit en sortie, rollback sur exception)
+
+        En `autocommit`, chaque requête est sa propre transaction : pas de BEGIN/COMMIT,
+        donc un seul aller-retour pour une requête isolée.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            if autocommit:
+                conn.autocommit = True
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self):
+        """Fermer toutes les connexions inactives et refuser les nouveaux emprunts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Métriques du pool (pour le dimensionner)"""
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min": self.minconn,
+                "max": self.maxconn,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total": round(self._wait_time, 6),
+                "wait_time_max": round(self._max_wait_time, 6),
+                "timeouts": self._timeouts,
+                "connections_created": self._created,
+                "connections_discarded": self._discarded,
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool du processus courant (recréé après un fork de gunicorn)"""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            pool = ConnectionPool(
+                os.getenv("DATABASE_URL"),
+                minconn=int(os.getenv("DB_POOL_MIN", "1")),
+                maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                health_check_interval=float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30")),
+            )
+            try:
+                pool.prefill()
+            except psycopg2.Error as e:
+                print(f"Error prefilling connection pool: {str(e)}")
+            _pool, _pool_pid = pool, os.getpid()
+    return _pool
@@ -0,0 +1,330 @@
+# Passerelle vers Gemini : un client (connexions HTTP keep-alive) et une configuration par processus,
+# délais bornés, nouveaux essais, disjoncteur et modèles de repli
+import importlib
+import os
+import random
+import threading
+import time
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+from metrics import registry
+
+# Erreurs transitoires : surcharge, quota, panne ou délai dépassé côté fournisseur
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+SYSTEM_PROMPT = """Tu es "Finker", un assistant IA expert en intelligence artificielle et sciences informatiques.
+Ta mission est d'enseigner les fondements de l'IA, du machine learning et de la science des données.
+- Tu t'appelles Finker et tu te présentes comme tel
+- Tu expliques avec clarté, pédagogie et structure
+- Tu adaptes ton niveau selon le niveau de l'utilisateur
+- Tu illustres tes propos avec des exemples concrets et des analogies du monde réel
+- Tu te souviens du contexte complet de la conversation pour des réponses cohérentes
+- Tu es amical, pédagogue et encourageant
+- Tu fournis des ressources supplémentaires pour approfondir les sujets abordés
+- Tu encourages l'utilisateur à poser des questions et à explorer davantage le sujet
+-Tu ne te présentes pas pendant trop longtemps et tu ne demandes pas trop d'informations à l'utilisateur"""
+
+SUMMARY_PROMPT = """Tu résumes une conversation de tutorat entre un utilisateur et Finker, un assistant qui enseigne l'IA.
+Intègre les nouveaux échanges au résumé existant. Conserve : le niveau et les objectifs de l'utilisateur,
+les notions déjà expliquées, les exemples et analogies utilisés, les questions restées en suspens.
+Réponds uniquement par le résumé mis à jour, en français, en moins de 300 mots."""
+
+TITLE_PROMPT = """Tu donnes un titre à une conversation entre un utilisateur et Finker, un assistant qui enseigne l'IA.
+Réponds uniquement par le titre : en français, 3 à 8 mots, sans guillemets ni ponctuation finale."""
+
+
+def _env_float(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def _env_list(name):
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+def is_retryable(error):
+    """Erreur qui vaut un nouvel essai (ou un autre modèle) plutôt qu'un échec immédiat"""
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class ModelUnavailable(Exception):
+    """Aucun modèle n'a répondu avant l'échéance (ou tous les disjoncteurs sont ouverts)"""
+
+    def __init__(self, message, retry_after=5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Disjoncteur d'un modèle : ouvert après `failure_threshold` échecs consécutifs,
+    un seul essai laissé passer après `reset_timeout` secondes (semi-ouvert)"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+def load_client_factory(backend):
+    """MODEL_BACKEND : "gemini" (défaut) ou "module:Classe" d'un client compatible (ex. bench.stub_model:StubClient)"""
+    if not backend or backend == "gemini":
+        return genai.Client
+    module_name, _, attr = backend.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class ModelGateway:
+    """Client Gemini réutilisé entre les requêtes + GenerateContentConfig précalculée
+
+    Chaque appel a une échéance globale (`deadline`) ; chaque requête HTTP est bornée par
+    `timeout` (y compris l'attente entre deux morceaux d'un flux). Avant le premier morceau,
+    une erreur transitoire est rejouée après un délai aléatoire, puis l'appel passe au modèle
+    de repli suivant ; après le premier morceau, l'erreur remonte (pas de texte dupliqué).
+    """
+
+    def __init__(self, api_key=None, model="gemini-flash-lite-latest", temperature=None,
+                 max_output_tokens=None, thinking_budget=0, system_prompt=SYSTEM_PROMPT, client_factory=None,
+                 fallback_models=(), timeout=30.0, deadline=60.0, max_retries=2, backoff_base=0.5,
+                 backoff_max=4.0, breaker_threshold=5, breaker_reset=30.0,
+                 embedding_model="gemini-embedding-001", embedding_dimensions=768, embedding_timeout=3.0):
+        self.api_key = api_key
+        self.client_factory = client_factory or genai.Client
+        self.model = model
+        self.models = [model] + [m for m in fallback_models if m != model]
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breakers = {m: CircuitBreaker(breaker_threshold, breaker_reset) for m in self.models}
+        self.system_prompt = system_prompt
+        # Immuable : construite une seule fois par processus
+        self.config = types.GenerateContentConfig(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            thinking_config=types.ThinkingConfig(thinking_budget=thinking_budget),
+            image_config=types.ImageConfig(image_size="1K"),
+            system_instruction=[types.Part.from_text(text=system_prompt)],
+        )
+        self.summary_config = types.GenerateContentConfig(
+            thinking_config=types.ThinkingConfig(thinking_budget=thinking_budget),
+            system_instruction=[types.Part.from_text(text=SUMMARY_PROMPT)],
+        )
+        self.title_config = types.GenerateContentConfig(
+            max_output_tokens=32,
+            thinking_config=types.ThinkingConfig(thinking_budget=thinking_budget),
+            system_instruction=[types.Part.from_text(text=TITLE_PROMPT)],
+        )
+        self.embedding_model = embedding_model
+        self.embedding_dimensions = embedding_dimensions
+        self.embedding_timeout = embedding_timeout
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Modèle et paramètres configurables par variables d'environnement"""
+        thinking_budget = _env_int("GEMINI_THINKING_BUDGET")
+        return cls(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            model=os.getenv("GEMINI_MODEL", "gemini-flash-lite-latest"),
+            temperature=_env_float("GEMINI_TEMPERATURE"),
+            max_output_tokens=_env_int("GEMINI_MAX_OUTPUT_TOKENS"),
+            thinking_budget=0 if thinking_budget is None else thinking_budget,
+            client_factory=load_client_factory(os.getenv("MODEL_BACKEND")),
+            fallback_models=_env_list("GEMINI_FALLBACK_MODELS"),
+            timeout=float(os.getenv("GEMINI_TIMEOUT", "30")),
+            deadline=float(os.getenv("GEMINI_DEADLINE", "60")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "2")),
+            breaker_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+            breaker_reset=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+            embedding_model=os.getenv("EMBEDDING_MODEL", "gemini-embedding-001"),
+            embedding_dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "768")),
+            embedding_timeout=float(os.getenv("EMBEDDING_TIMEOUT", "3")),
+        )
+
+    @property
+    def client(self):
+        """Client du processus courant (recréé après un fork : les sockets ne se partagent pas)"""
+        if self._client is not None and self._client_pid == os.getpid():
+            return self._client
+        with self._lock:
+            if self._client is None or self._client_pid != os.getpid():
+                self._client = self.client_factory(
+                    api_key=self.api_key,
+                    http_options=types.HttpOptions(timeout=int(self.timeout * 1000)),
+                )
+                self._client_pid = os.getpid()
+        return self._client
+
+    def build_contents(self, user_message, conversation_history=None):
+        """Historique complet + message courant au format Gemini"""
+        contents = []
+        for msg in conversation_history or []:
+            role = "user" if msg["role"] == "user" else "model"  # Gemini utilise "model" au lieu de "assistant"
+            contents.append(types.Content(role=role, parts=[types.Part.from_text(text=msg["content"])]))
+        contents.append(types.Content(role="user", parts=[types.Part.from_text(text=user_message)]))
+        return contents
+
+    def _call(self, request, stats=None, deadline=None):
+        """request(modèle) avec nouveaux essais puis repli sur les modèles suivants ; retourne (modèle, résultat)"""
+        deadline = deadline or time.monotonic() + self.deadline
+        last_error = None
+        for model in self.models:
+            breaker = self.breakers[model]
+            for attempt in range(self.max_retries + 1):
+                if time.monotonic() >= deadline:
+                    raise ModelUnavailable("Model deadline exceeded", retry_after=1.0) from last_error
+                if not breaker.allow():
+                    break
+                try:
+                    result = request(model)
+                except Exception as e:
+                    if not is_retryable(e):
+                        breaker.record_success()  # erreur de la requête, pas du modèle
+                        raise
+                    breaker.record_failure()
+                    last_error = e
+                    reason = str(e.code) if isinstance(e, errors.APIError) else type(e).__name__
+                    registry.counter("finker_llm_errors_total", "Retryable model errors", model=model, reason=reason)
+                    if stats is not None:
+                        stats["retries"] = stats.get("retries", 0) + 1
+                    # Délai exponentiel « full jitter » ; modèle suivant s'il dépasserait l'échéance
+                    pause = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                    if attempt == self.max_retries or time.monotonic() + pause >= deadline:
+                        break
+                    time.sleep(pause)
+                    continue
+                breaker.record_success()
+                if model != self.model:
+                    registry.counter("finker_llm_fallbacks_total", "Calls served by a fallback model", model=model)
+                return model, result
+        retry_after = min(self.breakers[m].retry_after() for m in self.models) or 1.0
+        raise ModelUnavailable(f"No model available: {str(last_error) if last_error else 'circuit open'}",
+                               retry_after=retry_after) from last_error
+
+    def stream(self, user_message, conversation_history=None, stats=None):
+        """Générer la réponse morceau par morceau (`stats` reçoit le modèle utilisé, les nouveaux essais,
+        le nombre de morceaux et de tokens)"""
+        if stats is None:
+            stats = {}
+        stats.setdefault("chunks", 0)
+        contents = self.build_contents(user_message, conversation_history)
+        
+        def first_chunk(model):
+            # La requête HTTP part au premier next() : les erreurs de connexion et de quota arrivent ici
+            iterator = iter(self.client.models.generate_content_stream(model=model, contents=contents,
+                                                                       config=self.config))
+            return next(iterator, None), iterator
+
+        deadline = time.monotonic() + self.deadline
+        model, (chunk, iterator) = self._call(first_chunk, stats, deadline)
+        stats["model"] = model
+        try:
+            while chunk is not None:
+                usage = chunk.usage_metadata
+                if usage is not None:
+                    stats["prompt_tokens"] = usage.prompt_token_count or 0
+                    stats["output_tokens"] = usage.candidates_token_count or 0
+                if chunk.text:
+                    stats["chunks"] += 1
+                    yield chunk.text
+                if time.monotonic() > deadline:
+                    raise ModelUnavailable("Model deadline exceeded while streaming", retry_after=1.0)
+                chunk = next(iterator, None)
+        except ModelUnavailable:
+            raise
+        except Exception:
+            self.breakers[model].record_failure()
+            raise
+
+    def _generate_text(self, contents, config):
+        _, response = self._call(
+            lambda model: self.client.models.generate_content(model=model, contents=contents, config=config)
+        )
+        return response.text or ""
+
+    def summarize(self, previous_summary, messages):
+        """Mettre à jour le résumé glissant avec des messages sortis de la fenêtre récente"""
+        transcript = "\n\n".join(
+            f"{'Utilisateur' if msg['role'] == 'user' else 'Finker'} : {msg['content']}" for msg in messages
+        )
+        prompt = f"Résumé actuel :\n{previous_summary or '(aucun)'}\n\nNouveaux échanges à intégrer :\n{transcript}"
+        return self._generate_text(prompt, self.summary_config).strip()
+
+    def title(self, user_message, assistant_message):
+        """Titre court d'une conversation à partir de son premier échange"""
+        prompt = f"Utilisateur : {user_message}\n\nFinker : {assistant_message[:2000]}"
+        lines = self._generate_text(prompt, self.title_config).strip().splitlines()
+        return lines[0].strip("\"'«» .")[:80] if lines else ""
+
+    def embed(self, texts, task_type="RETRIEVAL_DOCUMENT", timeout=None):
+        """Un vecteur (liste de floats) par texte, dans l'ordre ; un seul appel, sans nouvel essai
+
+        Les messages sont vectorisés par une tâche de fond (qui réessaie) ; la question courante
+        l'est sur le chemin critique, bornée par `timeout` secondes.
+        """
+        config = types.EmbedContentConfig(
+            task_type=task_type,
+            output_dimensionality=self.embedding_dimensions,
+            http_options=types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None,
+        )
+        response = self.client.models.embed_content(model=self.embedding_model, contents=texts, config=config)
+        registry.counter("finker_llm_embeddings_total", "Texts embedded", model=self.embedding_model,
+                         task=task_type, value=len(texts))
+        return [embedding.values for embedding in response.embeddings]
+
+    def breaker_states(self):
+        """{modèle: closed | open | half_open}"""
+        return {model: breaker.state for model, breaker in self.breakers.items()}
@@ -0,0 +1,33 @@
+# Configuration gunicorn : workers gevent (coopératifs) pour qu'un appel Gemini lent
+# n'immobilise pas un worker entier pendant toute la génération
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+# Nombre max de requêtes simultanées par worker gevent (greenlets)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
+
+
+def post_fork(server, worker):
+    """Rendre psycopg2 coopératif : une requête SQL en attente cède la main aux autres greenlets"""
+    if worker_class == "gevent":
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def on_starting(server):
+    """METRICS_DIR : repartir d'un répertoire vide (états des workers d'une exécution précédente)"""
+    if os.getenv("METRICS_DIR"):
+        from metrics import clear_shared_metrics
+        os.makedirs(os.getenv("METRICS_DIR"), exist_ok=True)
+        clear_shared_metrics(os.getenv("METRICS_DIR"))
+
+
+def child_exit(server, worker):
+    """Worker arrêté : retirer ses jauges des métriques partagées (ses compteurs restent dans les totaux)"""
+    if os.getenv("METRICS_DIR"):
+        from metrics import mark_process_dead
+        mark_process_dead(os.getenv("METRICS_DIR"), worker.pid)
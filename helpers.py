@@ -1,11 +1,89 @@
-# Décorateur pour vérifier la connexion
+from collections import OrderedDict
 from functools import wraps
 from flask import session, redirect
+import gzip
+import hashlib
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
+# Décorateur pour vérifier la connexion
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not session.get("user_id"):
             return redirect("/login")
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+class LRUCache:
+    """Cache LRU thread-safe à taille bornée, avec durée de vie optionnelle des entrées (secondes)"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # clé -> (valeur, expiration monotonic ou None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def content_hash(text):
+    """Empreinte courte d'un texte, utilisable comme clé de cache"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def make_etag(*parts):
+    """Valeur d'ETag dérivée de validateurs (ids, dates de mise à jour, paramètres de la page)"""
+    return content_hash(":".join(str(part) for part in parts))
+
+
+# Types compressés par compress_response (les flux NDJSON, déjà envoyés au fil de l'eau, ne le sont pas)
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain", "text/css", "application/javascript"}
+
+
+def compress_response(response, accept_encoding, min_size=1024, level=6):
+    """Compresser le corps (brotli si disponible et accepté, sinon gzip) s'il dépasse `min_size` octets"""
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    if brotli is not None and accept_encoding["br"]:
+        response.set_data(brotli.compress(data, quality=min(level, 11)))
+        response.headers["Content-Encoding"] = "br"
+    elif accept_encoding["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=min(level, 9)))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
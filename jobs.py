@@ -0,0 +1,192 @@
+# Tâches de fond : file durable dans public.jobs, exécutée par des threads du worker (ou `flask jobs-worker`)
+import os
+import random
+import threading
+import time
+import traceback
+
+from psycopg2 import errors
+from psycopg2.extras import Json, RealDictCursor
+
+from metrics import log_event, registry
+
+
+class JobQueue:
+    """File de tâches PostgreSQL consommée par un pool de threads par processus
+
+    Une tâche est réclamée avec FOR UPDATE SKIP LOCKED (plusieurs workers/dynos sans double
+    exécution), supprimée en cas de succès, reprogrammée avec un délai exponentiel en cas
+    d'échec, puis marquée `failed` après `max_attempts` essais. Une tâche restée `running`
+    au-delà de `lease_timeout` (worker arrêté en cours de route) est reprise.
+    """
+
+    def __init__(self, get_db, workers=2, poll_interval=2.0, max_attempts=5, lease_timeout=300,
+                 backoff_base=2.0, backoff_max=300.0):
+        self.get_db = get_db
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_timeout = lease_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._handlers = {}
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._running = 0
+
+    @classmethod
+    def from_env(cls, get_db):
+        return cls(
+            get_db,
+            workers=int(os.getenv("JOB_WORKERS", "2")),
+            poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "2")),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "5")),
+            lease_timeout=float(os.getenv("JOB_LEASE_TIMEOUT", "300")),
+        )
+
+    def handler(self, kind):
+        """Décorateur : fonction(payload) exécutant les tâches de ce type (une exception = nouvel essai)"""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def enqueue(self, kind, payload, dedupe_key=None):
+        """Ajouter une tâche (ignorée si une tâche de même `dedupe_key` est déjà en attente)"""
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT INTO public.jobs (kind, payload, dedupe_key) VALUES (%s, %s, %s)
+                   ON CONFLICT (dedupe_key) WHERE status = 'pending' DO NOTHING""",
+                (kind, Json(payload), dedupe_key)
+            )
+            cursor.close()
+        self.notify()
+
+    def notify(self):
+        """Réveiller les threads de ce processus sans attendre le prochain sondage"""
+        self._wakeup.set()
+
+    def start(self):
+        """Démarrer les threads du processus courant (une fois par processus, après le fork de gunicorn)"""
+        if self.workers <= 0 or self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True).start()
+
+    def run_forever(self):
+        """Processus dédié aux tâches (`flask jobs-worker`)"""
+        self.workers = max(self.workers, 1)
+        self.start()
+        while True:
+            time.sleep(3600)
+
+    def _run(self):
+        while True:
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                print(f"Error in job worker: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _claim(self):
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(
+                """UPDATE public.jobs
+                   SET status = 'running', locked_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                   WHERE id = (
+                       SELECT id FROM public.jobs
+                       WHERE (status = 'pending' AND run_at <= CURRENT_TIMESTAMP)
+                          OR (status = 'running' AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+                       ORDER BY run_at, id
+                       FOR UPDATE SKIP LOCKED
+                       LIMIT 1
+                   )
+                   RETURNING id, kind, payload, attempts""",
+                (self.lease_timeout,)
+            )
+            job = cursor.fetchone()
+            cursor.close()
+        return job
+
+    def run_once(self):
+        """Exécuter une tâche si une est disponible ; retourne False si la file est vide"""
+        job = self._claim()
+        if job is None:
+            return False
+        with self._lock:
+            self._running += 1
+        started = time.perf_counter()
+        try:
+            handler = self._handlers.get(job["kind"])
+            if handler is None:
+                raise RuntimeError(f"No handler for job kind {job['kind']}")
+            handler(job["payload"])
+        except Exception as e:
+            status = self._fail(job, e)
+        else:
+            status = self._finish(job)
+        finally:
+            with self._lock:
+                self._running -= 1
+        duration = time.perf_counter() - started
+        registry.counter("finker_jobs_total", "Background jobs run", kind=job["kind"], status=status)
+        registry.observe("finker_job_duration_seconds", "Background job duration", duration, kind=job["kind"])
+        log_event("job", job_id=job["id"], kind=job["kind"], status=status, attempts=job["attempts"],
+                  duration_ms=round(duration * 1000, 1))
+        return True
+
+    def _finish(self, job):
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM public.jobs WHERE id=%s", (job["id"],))
+            cursor.close()
+        return "done"
+
+    def _fail(self, job, error):
+        """Reprogrammer avec un délai exponentiel (et aléatoire), ou abandonner après max_attempts"""
+        print(f"Error in job {job['id']} ({job['kind']}), attempt {job['attempts']}: {str(error)}")
+        last_error = "".join(traceback.format_exception_only(type(error), error)).strip()
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            if job["attempts"] >= self.max_attempts:
+                cursor.execute(
+                    "UPDATE public.jobs SET status = 'failed', locked_at = NULL, last_error = %s WHERE id = %s",
+                    (last_error, job["id"])
+                )
+                cursor.close()
+                return "failed"
+            delay = min(self.backoff_max, self.backoff_base ** job["attempts"]) * random.uniform(0.5, 1.5)
+            try:
+                cursor.execute(
+                    """UPDATE public.jobs
+                       SET status = 'pending', locked_at = NULL, last_error = %s,
+                           run_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+                       WHERE id = %s""",
+                    (last_error, delay, job["id"])
+                )
+            except errors.UniqueViolation:
+                # Une tâche identique a été ajoutée entre-temps : elle fera le travail
+                cursor.execute("DELETE FROM public.jobs WHERE id=%s", (job["id"],))
+            cursor.close()
+        return "retry"
+
+    def stats(self):
+        """Tâches en cours dans ce processus + état de la file (partagée)"""
+        counts = {"pending": 0, "running": 0, "failed": 0}
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) FROM public.jobs GROUP BY status")
+            counts.update(dict(cursor.fetchall()))
+            cursor.close()
+        with self._lock:
+            counts["local_running"] = self._running
+        return counts
@@ -1,98 +1,229 @@
-from flask import Flask, jsonify, render_template, request, session, redirect
-from flask_session import Session
-from werkzeug.security import generate_password_hash, check_password_hash  
+from flask import Flask, Response, after_this_request, g, jsonify, render_template, request, session, redirect, stream_with_context
 from functools import wraps
-from helpers import login_required
-from google import genai
-from google.genai import types
-from markupsafe import Markup
+from helpers import LRUCache, compress_response, content_hash, login_required, make_etag
+from db import PoolTimeout, checkout_time, get_pool, reset_round_trips, round_trips
+from migrate import apply_migrations, check_query_plans
+from sessions import delete_expired_sessions, init_session, rotate_session
+from gateway import ModelGateway, ModelUnavailable
+from context_window import ContextWindow
+from retrieval import Retriever
+from response_cache import ResponseCache
+from jobs import JobQueue
+from admission import AdmissionControl, AdmissionRejected
+from transfer import ImportFormatError, export_conversations, import_conversations
+from passwords import PasswordHasher
+from metrics import log_event, record_stage, registry, timed
+from markupsafe import Markup, escape
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
 from dotenv import load_dotenv
 import markdown2
+import click
+import hmac
+import ipaddress
+import json
+import math
 import re
+import time
+import uuid
 
 # Charger les variables d'environnement du fichier .env
 load_dotenv()
 
 app = Flask(__name__)
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
+app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 app.secret_key = os.getenv("SECRET_KEY")
-Session(app)
 
-def get_db():
-    """Connexion à PostgreSQL/Supabase"""
-    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-    return conn
+# Client Gemini + configuration partagés par toutes les requêtes du processus
+gateway = ModelGateway.from_env()
+# Budget de contexte par requête : résumé stocké + derniers messages verbatim
+context_window = ContextWindow.from_env()
 
-# Les tables sont déjà créées dans Supabase, pas besoin d'init_db()
+def get_db(autocommit=False):
+    """Connexion poolée à PostgreSQL/Supabase (rendue au pool à la sortie du bloc `with`)"""
+    return get_pool().connection(autocommit=autocommit)
+
+# Sessions : cookie signé par défaut, ou store partagé (SESSION_BACKEND=postgres|redis)
+init_session(app, get_db)
+
+# Cache des réponses aux questions récurrentes (mémoire du worker + table partagée optionnelle)
+response_cache = ResponseCache.from_env(get_db)
+
+# Échanges anciens pertinents par embeddings (CONTEXT_MODE=retrieval)
+retriever = Retriever.from_env(get_db, gateway)
+
+# Métriques de tous les workers gunicorn fusionnées au scrape via un répertoire partagé (METRICS_DIR)
+registry.share(os.getenv("METRICS_DIR"), float(os.getenv("METRICS_FLUSH_INTERVAL", "10")))
+# Accès à /metrics : jeton Bearer ou adresses autorisées ; sans l'un ni l'autre, boucle locale seulement
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_ALLOWED_IPS = [ipaddress.ip_network(network.strip(), strict=False)
+                       for network in os.getenv("METRICS_ALLOWED_IPS", "").split(",") if network.strip()]
+
+# Tâches de fond (rendu HTML, titre, résumé) : file public.jobs, threads du worker ou `flask jobs-worker`
+job_queue = JobQueue.from_env(get_db)
+
+# Admission de /search : débit par utilisateur + appels au modèle simultanés bornés par worker
+admission = AdmissionControl.from_env(get_db)
+passwords = PasswordHasher.from_env()
+
+@app.cli.command("jobs-worker")
+def jobs_worker():
+    """Exécuter les tâches de fond dans un processus dédié (avec JOB_WORKERS=0 côté web)"""
+    registry.start()
+    job_queue.run_forever()
+
+def find_user_id(username):
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM public.users WHERE username=%s", (username.lower(),))
+        row = cursor.fetchone()
+        cursor.close()
+    if row is None:
+        raise click.ClickException(f"Unknown user: {username}")
+    return row[0]
+
+@app.cli.command("export-user")
+@click.argument("username")
+@click.argument("output", type=click.File("w", encoding="utf-8"), default="-")
+def export_user(username, output):
+    """Exporter les conversations d'un utilisateur en NDJSON (fichier ou sortie standard)"""
+    for line in export_conversations(get_db, find_user_id(username)):
+        output.write(line)
+
+@app.cli.command("import-user")
+@click.argument("username")
+@click.argument("source", type=click.File("rb"), default="-")
+def import_user(username, source):
+    """Importer un export NDJSON dans le compte d'un utilisateur"""
+    try:
+        counts = import_conversations(get_db, find_user_id(username), source)
+    except ImportFormatError as e:
+        raise click.ClickException(f"Invalid import file, {str(e)}")
+    print(f"Imported {counts['conversations']} conversations, {counts['messages']} messages")
+
+@app.cli.command("sessions-cleanup")
+def sessions_cleanup():
+    """Supprimer les sessions PostgreSQL expirées"""
+    print(f"Deleted {delete_expired_sessions(get_db)} expired sessions")
+
+@app.before_request
+def start_request():
+    """Identifiant de requête + remise à zéro des compteurs par requête"""
+    reset_round_trips()
+    job_queue.start()
+    registry.start()
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+    g.stages = {}
+
+@app.after_request
+def finish_request(response):
+    """Latence par route, requêtes SQL et log JSON, une fois la réponse entièrement envoyée (flux compris)"""
+    response.headers["X-Request-ID"] = g.request_id
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+    status = response.status_code
+    request_id = g.request_id
+    started = g.request_start
+    stages = g.stages
+    
+    def record():
+        duration = time.perf_counter() - started
+        db_round_trips = round_trips()
+        if checkout_time():
+            stages["db_checkout"] = round(checkout_time(), 6)
+        registry.counter("finker_requests_total", "HTTP requests", route=route, method=method, status=status)
+        registry.observe("finker_request_duration_seconds", "HTTP request latency (full body sent)", duration,
+                         route=route, method=method)
+        registry.observe("finker_db_round_trips", "SQL round trips per request", db_round_trips,
+                         buckets=(0, 1, 2, 3, 5, 8, 13, 21), route=route)
+        log_event("request", request_id=request_id, method=method, route=route, status=status,
+                  duration_ms=round(duration * 1000, 1), db_round_trips=db_round_trips, stages=stages)
+    
+    response.call_on_close(record)
+    return response
+
+# Compression des réponses JSON/HTML volumineuses (COMPRESS_MIN_SIZE=0 pour désactiver)
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+@app.after_request
+def compress(response):
+    if COMPRESS_MIN_SIZE <= 0:
+        return response
+    return compress_response(response, request.accept_encodings, COMPRESS_MIN_SIZE, COMPRESS_LEVEL)
+
+# Schéma versionné (migrations/) : `flask --app main db-upgrade`, ou au démarrage avec AUTO_MIGRATE=1
+def run_migrations():
+    with get_db() as conn:
+        applied = apply_migrations(conn)
+    for version, name in applied:
+        print(f"Applied migration {version:04d}_{name}")
+    return applied
+
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """Appliquer les migrations de schéma en attente"""
+    if not run_migrations():
+        print("Schema is up to date")
+
+@app.cli.command("db-check")
+def db_check():
+    """Vérifier par EXPLAIN que les requêtes critiques utilisent leurs index"""
+    with get_db() as conn:
+        results = check_query_plans(conn)
+    for result in results:
+        status = "OK  " if result["ok"] else "FAIL"
+        used = ", ".join(result["used"]) or "no index"
+        if result["seq_scan"]:
+            used += " + Seq Scan"
+        print(f"{status} {result['name']}: expected one of {', '.join(result['expected'])}, used {used}")
+    if not all(result["ok"] for result in results):
+        raise SystemExit(1)
+
+if os.getenv("AUTO_MIGRATE") == "1":
+    run_migrations()
+
+# Titre des conversations tant que le premier échange n'a pas été titré (tâche generate_title)
+DEFAULT_TITLE = "Nouvelle conversation"
+
+# Pagination de l'historique (la page la plus récente est chargée en premier)
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "50"))
+MESSAGES_PAGE_MAX = 200
+
+# Recherche plein texte : taille des pages de résultats, délimiteurs des termes trouvés dans les extraits
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 50
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\u27ea", "\u27eb"
+
+# Requêtes conditionnelles : le navigateur garde la réponse et la revalide à chaque appel (If-None-Match)
+REVALIDATE = "private, no-cache"
+
+# HTML des messages anciens (pas encore pré-rendus en base), indexé par empreinte du contenu
+markdown_cache = LRUCache(maxsize=int(os.getenv("MARKDOWN_CACHE_SIZE", "2048")))
 
 def markdown_to_html(text):
-    """Convertir du Markdown en HTML de manière sécurisée"""
+    """Convertir du Markdown en HTML de manière sécurisée (résultat mis en cache)"""
+    key = content_hash(text)
+    html = markdown_cache.get(key)
+    if html is not None:
+        return Markup(html)
     try:
         # Convertir le Markdown en HTML
         html = markdown2.markdown(text, extras=['tables', 'fenced-code-blocks', 'code-friendly'])
+        markdown_cache.set(key, html)
         return Markup(html)
     except Exception as e:
         print(f"Error converting markdown: {str(e)}")
         return Markup(f"<p>{text}</p>")
 
-def get_gemini_response(user_message, conversation_history=None):
-    """Obtenir une réponse de Gemini avec l'historique complet de la conversation"""
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    model = "gemini-flash-lite-latest"
-    
-    # Construire l'historique complet (CRUCIAL pour la mémoire du chatbot!)
-    contents = []
-    
-    # Ajouter l'historique si disponible
-    if conversation_history:
-        for msg in conversation_history:
-            role = "user" if msg["role"] == "user" else "model"  # Gemini utilise "model" au lieu de "assistant"
-            contents.append(
-                types.Content(
-                    role=role,
-                    parts=[types.Part.from_text(text=msg["content"])],
-                )
-            )
-    
-    # Ajouter le message actuel de l'utilisateur
-    contents.append(
-        types.Content(
-            role="user",
-            parts=[types.Part.from_text(text=user_message)],
-        )
-    )
-    
-    generate_content_config = types.GenerateContentConfig(
-        thinking_config=types.ThinkingConfig(thinking_budget=0),
-        image_config=types.ImageConfig(image_size="1K"),
-        system_instruction=[
-            types.Part.from_text(text="""Tu es "Finker", un assistant IA expert en intelligence artificielle et sciences informatiques.
-Ta mission est d'enseigner les fondements de l'IA, du machine learning et de la science des données.
-- Tu t'appelles Finker et tu te présentes comme tel
-- Tu expliques avec clarté, pédagogie et structure
-- Tu adaptes ton niveau selon le niveau de l'utilisateur
-- Tu illustres tes propos avec des exemples concrets et des analogies du monde réel
-- Tu te souviens du contexte complet de la conversation pour des réponses cohérentes
-- Tu es amical, pédagogue et encourageant
-- Tu fournis des ressources supplémentaires pour approfondir les sujets abordés
-- Tu encourages l'utilisateur à poser des questions et à explorer davantage le sujet
--Tu ne te présentes pas pendant trop longtemps et tu ne demandes pas trop d'informations à l'utilisateur"""),
-        ],
-    )
-    
-    response_text = ""
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    ):
-        response_text += chunk.text
-    
-    return response_text
+def message_html(row):
+    """HTML d'un message assistant : pré-rendu à l'écriture, sinon rendu à la volée (mis en cache)"""
+    if row.get("content_html"):
+        return Markup(row["content_html"])
+    return markdown_to_html(row["content"])
 
 def get_or_create_conversation(user_id, conversation_id=None):
     """Obtenir ou créer une conversation par défaut pour l'utilisateur"""
@@ -111,17 +242,343 @@ def get_or_create_conversation(user_id, conversation_id=None):
         # Créer une nouvelle conversation par défaut
         cursor.execute(
             "INSERT INTO public.conversations (user_id, title) VALUES (%s, %s) RETURNING id",
-            (user_id, "Nouvelle conversation")
+            (user_id, DEFAULT_TITLE)
         )
         new_conv = cursor.fetchone()
         conn.commit()
         cursor.close()
         return new_conv["id"]
 
+def load_conversation_history(cursor, user_id, conversation_id=None):
+    """Vérifier la propriété (ou créer la conversation) et charger résumé + messages non résumés en une seule requête"""
+    cursor.execute(
+        """WITH owned AS (
+               SELECT id, response_cache_enabled FROM public.conversations WHERE id=%s AND user_id=%s
+           ), created AS (
+               INSERT INTO public.conversations (user_id, title)
+               SELECT %s, %s WHERE NOT EXISTS (SELECT 1 FROM owned)
+               RETURNING id, response_cache_enabled
+           ), conv AS (
+               SELECT id, response_cache_enabled FROM owned UNION ALL SELECT id, response_cache_enabled FROM created
+           )
+           SELECT conv.id AS conversation_id, conv.response_cache_enabled, s.summary, h.id, h.role, h.content
+           FROM conv
+           LEFT JOIN public.conversation_summaries s ON s.conversation_id = conv.id
+           LEFT JOIN public.conversations_history h
+               ON h.conversation_id = conv.id AND h.id > COALESCE(s.summarized_until_id, 0)
+           ORDER BY h.id ASC""",
+        (conversation_id, user_id, user_id, DEFAULT_TITLE)
+    )
+    rows = cursor.fetchall()
+    return {
+        "id": rows[0]["conversation_id"],
+        "summary": rows[0]["summary"],
+        "response_cache_enabled": rows[0]["response_cache_enabled"],
+        "history": [{"id": row["id"], "role": row["role"], "content": row["content"]} for row in rows if row["role"]],
+    }
+
+def save_turn(cursor, user_id, conversation_id, user_message, assistant_message, generate_title=False, summarize=False,
+              embed=False, turn_id=None):
+    """INSERT les deux messages + UPDATE updated_at + tâches de fond (HTML, titre, résumé, embeddings) en une seule instruction
+
+    Avec `turn_id`, rejouer le même tour est sans effet (index unique turn_id, role) : aucun message
+    ni aucune tâche n'est ajouté, la conversation est retournée comme au premier passage.
+    """
+    cursor.execute(
+        """WITH conv AS (
+               UPDATE public.conversations
+               SET updated_at = CURRENT_TIMESTAMP
+               WHERE id = %s AND user_id = %s
+               RETURNING id, title, updated_at
+           ), msgs AS (
+               INSERT INTO public.conversations_history (conversation_id, user_id, role, content, turn_id)
+               SELECT conv.id, %s, m.role, m.content, %s::uuid
+               FROM conv, (VALUES (1, 'user', %s), (2, 'assistant', %s)) AS m(ord, role, content)
+               ORDER BY m.ord
+               ON CONFLICT (turn_id, role) WHERE turn_id IS NOT NULL DO NOTHING
+               RETURNING id, role
+           ), jobs AS (
+               INSERT INTO public.jobs (kind, payload, dedupe_key)
+               SELECT 'render_html', jsonb_build_object('message_id', msgs.id), NULL
+               FROM msgs WHERE msgs.role = 'assistant'
+               UNION ALL
+               SELECT 'generate_title', jsonb_build_object('conversation_id', conv.id), 'generate_title:' || conv.id
+               FROM conv WHERE %s AND conv.title = %s AND EXISTS (SELECT 1 FROM msgs)
+               UNION ALL
+               SELECT 'summarize', jsonb_build_object('conversation_id', conv.id), 'summarize:' || conv.id
+               FROM conv WHERE %s AND EXISTS (SELECT 1 FROM msgs)
+               UNION ALL
+               SELECT 'embed_messages', jsonb_build_object('conversation_id', conv.id), 'embed_messages:' || conv.id
+               FROM conv WHERE %s AND EXISTS (SELECT 1 FROM msgs)
+               ON CONFLICT (dedupe_key) WHERE status = 'pending' DO NOTHING
+           )
+           SELECT id, title, updated_at FROM conv""",
+        (conversation_id, user_id, user_id, turn_id, user_message, assistant_message,
+         generate_title, DEFAULT_TITLE, summarize, embed)
+    )
+    return cursor.fetchone()
+
+def fetch_messages_page(cursor, user_id, conversation_id, before=None, limit=None):
+    """Page de messages antérieurs à `before` (keyset sur l'id) + vérification de propriété en une requête"""
+    limit = limit or MESSAGES_PAGE_SIZE
+    cursor.execute(
+        """SELECT c.id AS conversation_id, c.updated_at AS conversation_updated_at,
+                  h.id, h.role, h.content, h.content_html, h.created_at
+           FROM public.conversations c
+           LEFT JOIN LATERAL (
+               SELECT id, role, content, content_html, created_at
+               FROM public.conversations_history
+               WHERE conversation_id = c.id AND id < %s
+               ORDER BY id DESC
+               LIMIT %s
+           ) h ON TRUE
+           WHERE c.id = %s AND c.user_id = %s""",
+        (before or 2147483647, limit + 1, conversation_id, user_id)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    updated_at = rows[0]["conversation_updated_at"]
+    rows = [row for row in rows if row["id"] is not None]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    # Convertir les messages en HTML
+    messages = [
+        {"id": row["id"], "role": row["role"], "created_at": row["created_at"],
+         "content": message_html(row) if row["role"] == "assistant" else row["content"]}
+        for row in rows
+    ]
+    return {
+        "messages": messages,
+        "has_more": has_more,
+        "next_before": messages[0]["id"] if has_more else None,
+        "updated_at": updated_at
+    }
+
+def not_modified(etag):
+    """Réponse 304 (sans corps) si le client a déjà la version `etag`, sinon None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    registry.counter("finker_not_modified_total", "Conditional GETs answered 304", route=request.url_rule.rule)
+    return with_etag(Response(status=304), etag)
+
+def with_etag(response, etag):
+    """ETag faible (le corps peut être compressé différemment) + revalidation obligatoire"""
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = REVALIDATE
+    return response
+
+def search_tsquery(text):
+    """Requête tsquery sûre : tous les mots requis, le dernier en préfixe (recherche pendant la frappe)"""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return " & ".join(words[:-1] + [words[-1] + ":*"])
+
+def search_messages(cursor, user_id, text, limit, offset=0):
+    """Messages de l'utilisateur correspondant à `text`, par pertinence ; extraits calculés pour la page seulement"""
+    query = search_tsquery(text)
+    if query is None:
+        return {"results": [], "has_more": False, "next_offset": None}
+    cursor.execute(
+        """WITH q AS (
+               SELECT to_tsquery('french', %s) AS query
+           ), hits AS (
+               SELECT h.id, h.conversation_id, h.role, h.content, h.created_at,
+                      ts_rank(h.content_tsv, q.query) AS rank
+               FROM public.conversations_history h, q
+               WHERE h.user_id = %s AND h.content_tsv @@ q.query
+               ORDER BY rank DESC, h.id DESC
+               LIMIT %s OFFSET %s
+           )
+           SELECT hits.id, hits.conversation_id, c.title, hits.role, hits.created_at, hits.rank,
+                  ts_headline('french', hits.content, q.query, %s) AS snippet
+           FROM hits
+           JOIN public.conversations c ON c.id = hits.conversation_id, q
+           ORDER BY hits.rank DESC, hits.id DESC""",
+        (query, user_id, limit + 1, offset,
+         f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", '
+         'MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=" … "')
+    )
+    rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    results = [
+        {
+            "message_id": row["id"],
+            "conversation_id": row["conversation_id"],
+            "conversation_title": row["title"],
+            "role": row["role"],
+            "created_at": row["created_at"],
+            "rank": round(row["rank"], 4),
+            # Texte échappé, seuls les termes trouvés sont balisés
+            "snippet": str(escape(row["snippet"])).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>"),
+        }
+        for row in rows[:limit]
+    ]
+    return {"results": results, "has_more": has_more, "next_offset": offset + limit if has_more else None}
+
+# Écriture d'un tour : essais immédiats sur erreur de connexion, puis tâche `save_turn` de la file
+TURN_SAVE_ATTEMPTS = int(os.getenv("TURN_SAVE_ATTEMPTS", "3"))
+
+def write_turn(turn):
+    """save_turn() sur une connexion du pool ; `turn` est aussi le payload de la tâche save_turn"""
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        updated_conv = save_turn(cursor, turn["user_id"], turn["conversation_id"], turn["user_message"],
+                                 turn["assistant_message"], generate_title=turn["generate_title"],
+                                 summarize=turn["summarize"], embed=turn["embed"], turn_id=turn.get("turn_id"))
+        cursor.close()
+    job_queue.notify()
+    return updated_conv
+
+def persist_turn(user_id, conversation, user_message, assistant_message):
+    """Enregistrer le tour et ses tâches de fond ; None si la conversation a disparu
+
+    Une erreur de connexion est rejouée TURN_SAVE_ATTEMPTS fois ; ensuite le tour est confié à la
+    file de tâches (nouveaux essais avec délai). L'exception ne remonte que si la mise en file
+    échoue aussi.
+    """
+    history = conversation["history"]
+    new_messages = [{"role": "user", "content": user_message}, {"role": "assistant", "content": assistant_message}]
+    turn = {
+        "turn_id": str(uuid.uuid4()),  # même id pour les essais immédiats et la tâche save_turn
+        "user_id": user_id,
+        "conversation_id": conversation["id"],
+        "user_message": user_message,
+        "assistant_message": assistant_message,
+        "generate_title": not history and not conversation["summary"],
+        "summarize": bool(context_window.messages_to_summarize(history + new_messages)),
+        "embed": context_window.mode == "retrieval",
+    }
+    for attempt in range(1, TURN_SAVE_ATTEMPTS + 1):
+        try:
+            with timed("turn_insert"):
+                return write_turn(turn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout) as e:
+            print(f"Error saving turn (attempt {attempt}/{TURN_SAVE_ATTEMPTS}): {str(e)}")
+            if attempt < TURN_SAVE_ATTEMPTS:
+                time.sleep(0.1 * 2 ** attempt)
+    registry.counter("finker_turns_deferred_total", "Turns handed to the job queue after failed inline writes")
+    job_queue.enqueue("save_turn", turn)
+    return {"id": turn["conversation_id"]}
+
+@job_queue.handler("save_turn")
+def save_turn_job(payload):
+    """Tour dont l'écriture immédiate a échoué (rejoué par la file jusqu'à JOB_MAX_ATTEMPTS)"""
+    if not write_turn(payload):
+        print(f"Error in save_turn job: conversation {payload['conversation_id']} no longer exists")
+
+@job_queue.handler("render_html")
+def render_html_job(payload):
+    """Pré-rendre le HTML d'une réponse pour les lectures suivantes (souvent déjà dans markdown_cache)"""
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT content FROM public.conversations_history WHERE id=%s AND content_html IS NULL",
+            (payload["message_id"],)
+        )
+        row = cursor.fetchone()
+        if row:
+            cursor.execute(
+                "UPDATE public.conversations_history SET content_html=%s WHERE id=%s",
+                (str(markdown_to_html(row[0])), payload["message_id"])
+            )
+        cursor.close()
+
+@job_queue.handler("generate_title")
+def generate_title_job(payload):
+    """Titrer la conversation d'après son premier échange (sauf si l'utilisateur l'a renommée entre-temps)"""
+    conversation_id = payload["conversation_id"]
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            "SELECT role, content FROM public.conversations_history WHERE conversation_id=%s ORDER BY id ASC LIMIT 2",
+            (conversation_id,)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    if len(rows) < 2:
+        return
+    title = gateway.title(rows[0]["content"], rows[1]["content"])
+    if not title:
+        raise RuntimeError("Empty title from model")
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE public.conversations SET title=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s AND title=%s",
+            (title, conversation_id, DEFAULT_TITLE)
+        )
+        cursor.close()
+
+@job_queue.handler("summarize")
+def summarize_job(payload):
+    """Fondre les messages sortis de la fenêtre récente dans le résumé stocké"""
+    conversation_id = payload["conversation_id"]
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            """SELECT s.summary, h.id, h.role, h.content
+               FROM public.conversations c
+               LEFT JOIN public.conversation_summaries s ON s.conversation_id = c.id
+               LEFT JOIN public.conversations_history h
+                   ON h.conversation_id = c.id AND h.id > COALESCE(s.summarized_until_id, 0)
+               WHERE c.id = %s
+               ORDER BY h.id ASC""",
+            (conversation_id,)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    if not rows:
+        return  # conversation supprimée
+    history = [{"id": row["id"], "role": row["role"], "content": row["content"]} for row in rows if row["role"]]
+    messages = context_window.messages_to_summarize(history)
+    if not messages:
+        return
+    summary = gateway.summarize(rows[0]["summary"], messages)
+    if not summary:
+        raise RuntimeError("Empty summary from model")
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor()
+        # Ne jamais écraser un résumé plus avancé écrit par une tâche concurrente
+        cursor.execute(
+            """INSERT INTO public.conversation_summaries (conversation_id, summary, summarized_until_id)
+               VALUES (%s, %s, %s)
+               ON CONFLICT (conversation_id) DO UPDATE
+               SET summary = EXCLUDED.summary,
+                   summarized_until_id = EXCLUDED.summarized_until_id,
+                   updated_at = CURRENT_TIMESTAMP
+               WHERE public.conversation_summaries.summarized_until_id < EXCLUDED.summarized_until_id""",
+            (conversation_id, summary, messages[-1]["id"])
+        )
+        cursor.close()
+
+@job_queue.handler("embed_messages")
+def embed_messages_job(payload):
+    """Calculer les embeddings manquants de la conversation (tour courant, ou historique entier au premier passage)"""
+    retriever.embed_missing(payload["conversation_id"])
+
+def retrieve_context(conversation, user_message):
+    """Échanges anciens pertinents pour ce tour (CONTEXT_MODE=retrieval) ; None = derniers messages seulement"""
+    history = conversation["history"]
+    if len(history) <= context_window.recent_messages and not conversation["summary"]:
+        return None  # tout l'historique est déjà dans la fenêtre récente
+    recent = history[-context_window.recent_messages:]
+    try:
+        with timed("context_retrieval"):
+            turns = retriever.relevant_turns(conversation["id"], user_message, recent[0]["id"] if recent else 2147483647)
+    except Exception as e:
+        print(f"Error in /search (retrieval): {str(e)}")
+        registry.counter("finker_context_retrieval_total", "Context retrieval attempts", outcome="error")
+        return None
+    registry.counter("finker_context_retrieval_total", "Context retrieval attempts",
+                     outcome="fallback" if turns is None else "hit" if turns else "empty")
+    return turns
+
 @app.route("/search", methods=["POST"])
 @login_required
 def search():
-    """Route API pour traiter les messages du chatbot via fetch - SELECT...UPDATE optimisé"""
+    """Route API pour traiter les messages du chatbot via fetch - 2 allers-retours SQL par tour"""
     user_id = session.get("user_id")
     
     try:
@@ -135,80 +592,199 @@ def search():
         if not user_message:
             return jsonify({"error": "Empty message"}), 400
         
-        # Obtenir ou créer une conversation
-        conversation_id = get_or_create_conversation(user_id, conversation_id)
+        # Admission : débit de l'utilisateur, puis une place parmi les appels au modèle en cours
+        try:
+            admission.check_rate(f"search:{user_id}")
+            waited = admission.acquire()
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        if waited:
+            registry.counter("finker_admission_queued_total", "Requests that waited for a model slot")
+            record_stage("admission_wait", waited)
         
-        # ✅ RÉCUPÉRER L'HISTORIQUE COMPLET de la conversation (CRUCIAL!)
-        conversation_history = []
-        with get_db() as conn:
+        # Place rendue une fois la réponse entièrement envoyée (flux compris), quelle que soit l'issue
+        @after_this_request
+        def release_model_slot(response):
+            response.call_on_close(admission.release)
+            return response
+        
+        # ✅ Propriété (ou création) + HISTORIQUE COMPLET en un seul aller-retour (CRUCIAL!)
+        with get_db(autocommit=True) as conn:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # SELECT l'historique des messages pour cette conversation
-            cursor.execute(
-                """SELECT role, content FROM public.conversations_history 
-                   WHERE conversation_id=%s AND user_id=%s 
-                   ORDER BY created_at ASC""",
-                (conversation_id, user_id)
-            )
-            conversation_history = cursor.fetchall()
+            with timed("history_select"):
+                conversation = load_conversation_history(cursor, user_id, conversation_id)
             cursor.close()
+        conversation_id = conversation["id"]
+        conversation_history = conversation["history"]
+        summary = conversation["summary"]
         
-        # Stocker le message utilisateur
-        with get_db() as conn:
-            cursor = conn.cursor()
-            
-            # INSERT le message utilisateur
-            cursor.execute(
-                "INSERT INTO public.conversations_history (conversation_id, user_id, role, content) VALUES (%s, %s, %s, %s)",
-                (conversation_id, user_id, "user", user_message)
-            )
-            conn.commit()
+        # Contexte borné : résumé des anciens échanges + derniers messages dans le budget de tokens
+        # (+ échanges anciens pertinents en mode retrieval)
+        retrieved = retrieve_context(conversation, user_message) if context_window.mode == "retrieval" else None
+        context_messages = context_window.build(summary, conversation_history, retrieved)
+        
+        # Questions récurrentes (premiers tours) : réponse servie depuis le cache si possible
+        cache_key = None
+        if conversation["response_cache_enabled"] and not data.get("no_cache"):
+            cache_key = response_cache.key_for(user_message, conversation_history, summary,
+                                               gateway.model, gateway.system_prompt)
         
-        # ✅ Obtenir la réponse de Gemini AVEC l'historique complet
-        gemini_response = get_gemini_response(user_message, conversation_history)
+        if data.get("stream"):
+            return stream_search(user_id, conversation, user_message, context_messages, cache_key)
+        
+        # ✅ Obtenir la réponse de Gemini AVEC le contexte (aucune connexion tenue pendant l'appel)
+        try:
+            gemini_response = "".join(stream_answer(user_message, context_messages, cache_key))
+        except ModelUnavailable as e:
+            return model_unavailable(e)
         
         if not gemini_response or gemini_response.strip() == "":
             return jsonify({"error": "No response from AI"}), 500
         
-        # INSERT la réponse + UPDATE only updated_at (metadata)
-        with get_db() as conn:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # INSERT la réponse AI
-            cursor.execute(
-                "INSERT INTO public.conversations_history (conversation_id, user_id, role, content) VALUES (%s, %s, %s, %s)",
-                (conversation_id, user_id, "assistant", gemini_response)
-            )
-            
-            # UPDATE: just update the timestamp (vérification de propriété incluse)
-            cursor.execute('''
-                UPDATE public.conversations 
-                SET updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s 
-                AND user_id = %s
-                RETURNING id, title, updated_at
-            ''', (conversation_id, user_id))
-            
-            updated_conv = cursor.fetchone()
-            conn.commit()
-            cursor.close()
-            
-            if not updated_conv:
-                return jsonify({"error": "Conversation not found or unauthorized"}), 403
+        # HTML pour l'affichage (gardé dans markdown_cache : la tâche render_html du worker le retrouve)
+        with timed("markdown_render"):
+            response_html = markdown_to_html(gemini_response)
         
-        # Convertir la réponse en HTML pour affichage
-        response_html = markdown_to_html(gemini_response)
+        # INSERT du tour + tâches de fond en un seul aller-retour, avant de répondre : un client API
+        # qui enchaîne aussitôt le tour suivant retrouve cet échange dans l'historique
+        if not persist_turn(user_id, conversation, user_message, gemini_response):
+            return jsonify({"error": "Conversation not found or unauthorized"}), 404
+        log_event("search_turn", conversation_id=conversation_id, db_round_trips=round_trips())
         
         return jsonify({
             "conversation_id": conversation_id,
             "user_message": user_message,
             "assistant_response": gemini_response,
-            "assistant_response_html": str(response_html)
+            "assistant_response_html": str(response_html),
+            "title_pending": not conversation_history and not summary
         }), 200
     except Exception as e:
         print(f"Error in /search: {str(e)}")
         return jsonify({"error": "Server error: " + str(e)}), 500
 
+def too_many_requests(error):
+    """Réponse 429 avec Retry-After"""
+    registry.counter("finker_admission_rejected_total", "Requests rejected by admission control", reason=error.reason)
+    retry_after = max(1, math.ceil(error.retry_after))
+    response = jsonify({"error": "Too many requests, please retry later", "retry_after": retry_after})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 429
+
+def model_unavailable(error):
+    """Réponse 503 avec Retry-After quand aucun modèle n'a répondu à temps"""
+    print(f"Error in /search: {str(error)}")
+    retry_after = max(1, math.ceil(error.retry_after))
+    response = jsonify({"error": "The AI model is temporarily unavailable, please retry", "retry_after": retry_after})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 503
+
+def ndjson(event):
+    """Sérialiser un événement du flux /search (une ligne JSON)"""
+    return json.dumps(event, default=str) + "\n"
+
+def stream_answer(user_message, context_messages, cache_key=None):
+    """Morceaux de la réponse : depuis le cache de réponses si la clé y est, sinon depuis Gemini (puis mis en cache)"""
+    if cache_key:
+        with timed("response_cache_lookup"):
+            cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    stats = {}
+    started = time.perf_counter()
+    for text in gateway.stream(user_message, context_messages, stats=stats):
+        if not parts:
+            record_stage("llm_first_chunk", time.perf_counter() - started)
+        parts.append(text)
+        yield text
+    record_stage("llm_total", time.perf_counter() - started)
+    registry.counter("finker_llm_calls_total", "Model calls", model=stats["model"])
+    registry.counter("finker_llm_chunks_total", "Streamed chunks received from the model", stats["chunks"])
+    registry.counter("finker_llm_prompt_tokens_total", "Prompt tokens billed", stats.get("prompt_tokens", 0))
+    registry.counter("finker_llm_output_tokens_total", "Output tokens billed", stats.get("output_tokens", 0))
+    answer = "".join(parts)
+    if cache_key and answer.strip():
+        response_cache.set(cache_key, answer)
+
+def stream_search(user_id, conversation, user_message, context_messages, cache_key=None):
+    """Relayer chaque morceau de la réponse Gemini au navigateur (NDJSON), puis persister le tour complet (même si le navigateur se déconnecte en cours de route)"""
+    conversation_id = conversation["id"]
+    conversation_history = conversation["history"]
+    summary = conversation["summary"]
+    
+    def generate():
+        started = time.monotonic()
+        first_chunk_at = None
+        parts = []
+        connected = True
+        yield ndjson({"type": "start", "conversation_id": conversation_id})
+        try:
+            answer = stream_answer(user_message, context_messages, cache_key)
+            for text in answer:
+                if first_chunk_at is None:
+                    first_chunk_at = time.monotonic()
+                parts.append(text)
+                try:
+                    yield ndjson({"type": "chunk", "text": text})
+                except GeneratorExit:
+                    # Navigateur parti (onglet fermé, réseau coupé) : la réponse est menée à terme
+                    # puis enregistrée, sans plus rien envoyer
+                    connected = False
+                    parts.extend(answer)
+                    break
+            
+            gemini_response = "".join(parts)
+            if not gemini_response.strip():
+                if connected:
+                    yield ndjson({"type": "error", "error": "No response from AI"})
+                return
+            
+            if connected:
+                with timed("markdown_render"):
+                    response_html = str(markdown_to_html(gemini_response))
+                
+                # La réponse est complète côté navigateur avant l'écriture en base
+                try:
+                    yield ndjson({
+                        "type": "done",
+                        "conversation_id": conversation_id,
+                        "assistant_response": gemini_response,
+                        "assistant_response_html": response_html,
+                        "title_pending": not conversation_history and not summary
+                    })
+                except GeneratorExit:
+                    connected = False
+            
+            # INSERT du tour + tâches de fond (HTML stocké, titre, résumé) en un seul aller-retour
+            updated_conv = persist_turn(user_id, conversation, user_message, gemini_response)
+            
+            ttft = (first_chunk_at or time.monotonic()) - started
+            registry.observe("finker_time_to_first_token_seconds", "Streamed /search time to first token", ttft)
+            if not connected:
+                registry.counter("finker_stream_disconnects_total", "Streamed answers saved after the client left")
+            log_event("search_turn", conversation_id=conversation_id, stream=True, client_connected=connected,
+                      time_to_first_token_ms=round(ttft * 1000, 1),
+                      total_ms=round((time.monotonic() - started) * 1000, 1), db_round_trips=round_trips())
+            
+            if not updated_conv and connected:
+                yield ndjson({"type": "error", "error": "Conversation not found or unauthorized"})
+        except ModelUnavailable as e:
+            print(f"Error in /search (stream): {str(e)}")
+            if connected:
+                yield ndjson({"type": "error", "error": "The AI model is temporarily unavailable, please retry",
+                              "retry_after": max(1, math.ceil(e.retry_after))})
+        except Exception as e:
+            print(f"Error in /search (stream): {str(e)}")
+            if connected:
+                yield ndjson({"type": "error", "error": "Server error: " + str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route("/", methods=["GET", "POST"])
 @login_required
 def home():
@@ -217,35 +793,18 @@ def home():
     # Récupérer conversation_id depuis l'URL ou créer une nouvelle
     conversation_id = request.args.get('conversation_id', type=int)
     
-    # Si pas de conversation_id, créer ou récupérer une conversation par défaut
-    if not conversation_id:
-        conversation_id = get_or_create_conversation(user_id)
-    else:
-        # Vérifier que la conversation appartient à l'utilisateur
-        with get_db() as conn:
+    # Vérifier que la conversation appartient à l'utilisateur + dernière page de messages (SELECT)
+    page = None
+    if conversation_id:
+        with get_db(autocommit=True) as conn:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("SELECT id FROM public.conversations WHERE id=%s AND user_id=%s",
-                          (conversation_id, user_id))
-            if not cursor.fetchone():
-                cursor.close()
-                # Si conversation invalide, créer une nouvelle
-                conversation_id = get_or_create_conversation(user_id)
+            page = fetch_messages_page(cursor, user_id, conversation_id)
             cursor.close()
     
-    # Récupérer l'historique des messages (SELECT)
-    messages = []
-    with get_db() as conn:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(
-            "SELECT role, content FROM public.conversations_history WHERE conversation_id=%s AND user_id=%s ORDER BY created_at ASC",
-            (conversation_id, user_id)
-        )
-        rows = cursor.fetchall()
-        cursor.close()
-        messages = [
-            {"role": row["role"], "content": markdown_to_html(row["content"]) if row["role"] == "assistant" else row["content"]} 
-            for row in rows
-        ]
+    # Si pas de conversation_id (ou conversation invalide), créer une nouvelle conversation
+    if page is None:
+        conversation_id = get_or_create_conversation(user_id)
+        page = {"messages": [], "has_more": False, "next_before": None}
     
     # Récupérer toutes les conversations de l'utilisateur (SELECT)
     conversations = []
@@ -267,7 +826,8 @@ def home():
         cursor.close()
     
     return render_template("dashboard.html", 
-                         messages=messages, 
+                         messages=page["messages"], 
+                         has_more_messages=page["has_more"],
                          user_id=user_id,
                          username=username,
                          conversation_id=conversation_id,
@@ -276,12 +836,24 @@ def home():
 @app.route("/api/conversations", methods=["GET"])
 @login_required
 def get_conversations():
-    """Lister toutes les conversations de l'utilisateur (SELECT)"""
+    """Lister toutes les conversations de l'utilisateur (SELECT), 304 si la liste n'a pas changé"""
     user_id = session.get("user_id")
     
     try:
-        with get_db() as conn:
+        with get_db(autocommit=True) as conn:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
+            if request.if_none_match:
+                # Validateur bon marché (index user_id, updated_at) : toute création, suppression ou
+                # modification (message, titre) change le nombre ou le dernier updated_at
+                cursor.execute(
+                    "SELECT COUNT(*) AS count, MAX(updated_at) AS updated_at FROM public.conversations WHERE user_id=%s",
+                    (user_id,)
+                )
+                row = cursor.fetchone()
+                response = not_modified(make_etag(user_id, row["count"], row["updated_at"]))
+                if response is not None:
+                    cursor.close()
+                    return response
             cursor.execute(
                 "SELECT id, title, updated_at FROM public.conversations WHERE user_id=%s ORDER BY updated_at DESC",
                 (user_id,)
@@ -289,7 +861,8 @@ def get_conversations():
             conversations = cursor.fetchall()
             cursor.close()
         
-        return jsonify(conversations), 200
+        etag = make_etag(user_id, len(conversations), conversations[0]["updated_at"] if conversations else None)
+        return with_etag(jsonify(conversations), etag), 200
     except Exception as e:
         print(f"Error in /api/conversations: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -297,39 +870,87 @@ def get_conversations():
 @app.route("/api/conversations/<int:conversation_id>", methods=["GET"])
 @login_required
 def get_conversation_messages(conversation_id):
-    """Récupérer les messages d'une conversation spécifique (SELECT)"""
+    """Récupérer une page de messages d'une conversation (SELECT paginé par id, plus récents d'abord)
+
+    Chaque ajout ou suppression de message met à jour conversations.updated_at : la page est
+    inchangée tant que cette date l'est, et la 304 ne coûte qu'une lecture par clé primaire.
+    """
     user_id = session.get("user_id")
+    before = request.args.get("before", type=int)
+    limit = min(max(request.args.get("limit", MESSAGES_PAGE_SIZE, type=int), 1), MESSAGES_PAGE_MAX)
     
     try:
-        with get_db() as conn:
+        with get_db(autocommit=True) as conn:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Vérifier que la conversation appartient à l'utilisateur
-            cursor.execute("SELECT id FROM public.conversations WHERE id=%s AND user_id=%s", 
-                          (conversation_id, user_id))
-            if not cursor.fetchone():
-                cursor.close()
-                return jsonify({"error": "Conversation not found"}), 404
-            
-            # Récupérer les messages
-            cursor.execute(
-                "SELECT role, content, created_at FROM public.conversations_history WHERE conversation_id=%s ORDER BY created_at ASC",
-                (conversation_id,)
-            )
-            messages = cursor.fetchall()
+            if request.if_none_match:
+                cursor.execute(
+                    "SELECT updated_at FROM public.conversations WHERE id=%s AND user_id=%s",
+                    (conversation_id, user_id)
+                )
+                row = cursor.fetchone()
+                if row is not None:
+                    response = not_modified(make_etag(user_id, conversation_id, row["updated_at"], before, limit))
+                    if response is not None:
+                        cursor.close()
+                        return response
+            page = fetch_messages_page(cursor, user_id, conversation_id, before, limit)
             cursor.close()
         
-        # Convertir les messages en HTML
-        formatted_messages = [
-            {"role": msg["role"], "content": markdown_to_html(msg["content"]) if msg["role"] == "assistant" else msg["content"]} 
-            for msg in messages
-        ]
+        if page is None:
+            return jsonify({"error": "Conversation not found"}), 404
         
-        return jsonify(formatted_messages), 200
+        etag = make_etag(user_id, conversation_id, page["updated_at"], before, limit)
+        return with_etag(jsonify(page), etag), 200
     except Exception as e:
         print(f"Error in /api/conversations/<id>: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/search", methods=["GET"])
+@login_required
+def search_history():
+    """Rechercher dans tous les messages de l'utilisateur (index plein texte, résultats par pertinence)"""
+    user_id = session.get("user_id")
+    text = request.args.get("q", "").strip()
+    limit = min(max(request.args.get("limit", SEARCH_PAGE_SIZE, type=int), 1), SEARCH_PAGE_MAX)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    
+    try:
+        with get_db(autocommit=True) as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            page = search_messages(cursor, user_id, text, limit, offset)
+            cursor.close()
+        
+        return jsonify(dict(page, query=text)), 200
+    except Exception as e:
+        print(f"Error in /api/search: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/export", methods=["GET"])
+@login_required
+def export_history():
+    """Exporter toutes les conversations de l'utilisateur en NDJSON (flux, curseur côté serveur)"""
+    user_id = session.get("user_id")
+    return Response(
+        stream_with_context(export_conversations(get_db, user_id)),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="finker-export.ndjson"'}
+    )
+
+@app.route("/api/import", methods=["POST"])
+@login_required
+def import_history():
+    """Importer un export NDJSON (lu ligne à ligne, messages insérés par lots) dans le compte courant"""
+    user_id = session.get("user_id")
+    
+    try:
+        counts = import_conversations(get_db, user_id, request.stream)
+        return jsonify(counts), 201
+    except ImportFormatError as e:
+        return jsonify({"error": f"Invalid import file, {str(e)}"}), 400
+    except Exception as e:
+        print(f"Error in /api/import: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/conversations/new", methods=["POST"])
 @login_required
 def create_conversation():
@@ -338,10 +959,10 @@ def create_conversation():
     
     try:
         data = request.get_json()
-        title = data.get("title", "Nouvelle conversation").strip()
+        title = data.get("title", DEFAULT_TITLE).strip()
         
         if not title:
-            title = "Nouvelle conversation"
+            title = DEFAULT_TITLE
         
         with get_db() as conn:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -361,15 +982,22 @@ def create_conversation():
 @app.route("/api/conversations/<int:conversation_id>/update", methods=["PUT"])
 @login_required
 def update_conversation(conversation_id):
-    """Renommer une conversation (UPDATE)"""
+    """Renommer une conversation et/ou activer-désactiver son cache de réponses (UPDATE)"""
     user_id = session.get("user_id")
     
     try:
         data = request.get_json()
-        new_title = data.get("title", "").strip()
+        new_title = data.get("title")
+        response_cache_enabled = data.get("response_cache")
         
-        if not new_title:
-            return jsonify({"error": "Title cannot be empty"}), 400
+        if new_title is None and response_cache_enabled is None:
+            return jsonify({"error": "Nothing to update"}), 400
+        if new_title is not None:
+            new_title = new_title.strip()
+            if not new_title:
+                return jsonify({"error": "Title cannot be empty"}), 400
+        if response_cache_enabled is not None and not isinstance(response_cache_enabled, bool):
+            return jsonify({"error": "response_cache must be a boolean"}), 400
         
         with get_db() as conn:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -381,10 +1009,14 @@ def update_conversation(conversation_id):
                 cursor.close()
                 return jsonify({"error": "Conversation not found"}), 404
             
-            # UPDATE le titre
+            # UPDATE le titre et/ou l'opt-out du cache (les champs absents restent inchangés)
             cursor.execute(
-                "UPDATE public.conversations SET title=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s RETURNING id, title",
-                (new_title, conversation_id)
+                """UPDATE public.conversations
+                   SET title=COALESCE(%s, title),
+                       response_cache_enabled=COALESCE(%s, response_cache_enabled),
+                       updated_at=CURRENT_TIMESTAMP
+                   WHERE id=%s RETURNING id, title, response_cache_enabled""",
+                (new_title, response_cache_enabled, conversation_id)
             )
             conversation = cursor.fetchone()
             conn.commit()
@@ -454,6 +1086,10 @@ def delete_message(conversation_id):
                 cursor.close()
                 return jsonify({"error": "Message not found"}), 404
             
+            # Invalider les ETag de la conversation et de la liste
+            cursor.execute("UPDATE public.conversations SET updated_at=CURRENT_TIMESTAMP WHERE id=%s",
+                          (conversation_id,))
+            
             conn.commit()
             cursor.close()
         
@@ -496,9 +1132,10 @@ def register():
             error = "Password must contain at least one special character."
         else:
             try:
+                # Hachage avant d'emprunter une connexion : elle n'est pas retenue pendant le calcul
+                hash_password = passwords.hash(password)
                 with get_db() as conn:
                     cursor = conn.cursor()
-                    hash_password = generate_password_hash(password)
                     cursor.execute("INSERT INTO public.users (username, password) VALUES (%s, %s)", (username, hash_password))
                     conn.commit()
                     cursor.close()
@@ -507,6 +1144,20 @@ def register():
                 error = "User already exists."
     return render_template("register.html", error=error, user_id=session.get("user_id"))
 
+def rehash_password(user, password):
+    """Re-hacher avec les paramètres courants (PASSWORD_HASH_METHOD) au login, seul moment où le mot de passe est connu"""
+    try:
+        new_hash = passwords.hash(password)
+        with get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            # Condition sur l'ancien hachage : un changement de mot de passe concurrent l'emporte
+            cursor.execute("UPDATE public.users SET password=%s WHERE id=%s AND password=%s",
+                           (new_hash, user["id"], user["password"]))
+            cursor.close()
+        registry.counter("finker_password_rehash_total", "Password hashes upgraded at login")
+    except Exception as e:
+        print(f"Error in /login (rehash): {str(e)}")
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     error = None
@@ -516,18 +1167,70 @@ def login():
         if not username or not password:
             error = "Please fill in all fields."
         else:
-            with get_db() as conn:
+            with get_db(autocommit=True) as conn:
                 cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute("SELECT * FROM public.users WHERE username=%s", (username,))
+                cursor.execute("SELECT id, password FROM public.users WHERE username=%s", (username,))
                 user = cursor.fetchone()
                 cursor.close()
-                if user and check_password_hash(user["password"], password):
-                    session["user_id"] = user["id"]
-                    return redirect("/")
-                else:
-                    error = "Invalid credentials."
+            if user and passwords.verify(user["password"], password):
+                if passwords.needs_rehash(user["password"]):
+                    rehash_password(user, password)
+                # Rien de la session d'avant la connexion n'est conservé, et son identifiant change
+                session.clear()
+                session["user_id"] = user["id"]
+                rotate_session(app, session)
+                return redirect("/")
+            else:
+                error = "Invalid credentials."
     return render_template("login.html", error=error, user_id=session.get("user_id"))
 
+@registry.collector
+def pool_and_cache_metrics():
+    """Pool de connexions, caches et file de tâches du worker courant, lus au moment de l'export"""
+    pool = get_pool().stats()
+    for name in ("size", "idle", "in_use"):
+        yield f"finker_db_pool_{name}", "gauge", {}, pool[name]
+    for name in ("checkouts", "waits", "timeouts", "connections_created", "connections_discarded"):
+        yield f"finker_db_pool_{name}_total", "counter", {}, pool[name]
+    yield "finker_db_pool_wait_seconds_total", "counter", {}, pool["wait_time_total"]
+    for name, value in response_cache.stats().items():
+        yield f"finker_response_cache_{name}" + ("" if name == "size" else "_total"), \
+            "gauge" if name == "size" else "counter", {}, value
+    yield "finker_markdown_cache_hits_total", "counter", {}, markdown_cache.hits
+    yield "finker_markdown_cache_misses_total", "counter", {}, markdown_cache.misses
+    try:
+        jobs = job_queue.stats()
+    except Exception as e:
+        print(f"Error reading job queue stats: {str(e)}")
+    else:
+        for status in ("pending", "running", "failed"):
+            yield "finker_jobs_queued", "gauge", {"status": status}, jobs[status]
+        yield "finker_jobs_local_running", "gauge", {}, jobs["local_running"]
+    for name, value in admission.stats().items():
+        yield f"finker_admission_{name}", "gauge", {}, value
+    for model, state in gateway.breaker_states().items():
+        yield "finker_llm_circuit_open", "gauge", {"model": model}, int(state != "closed")
+
+def metrics_allowed():
+    """Jeton METRICS_TOKEN valide, ou adresse dans METRICS_ALLOWED_IPS (boucle locale si aucun des deux)"""
+    if METRICS_TOKEN and hmac.compare_digest(request.headers.get("Authorization", "").encode(),
+                                             f"Bearer {METRICS_TOKEN}".encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or "")
+    except ValueError:
+        return False
+    if METRICS_ALLOWED_IPS:
+        return any(address in network for network in METRICS_ALLOWED_IPS)
+    return not METRICS_TOKEN and address.is_loopback
+
+@app.route("/metrics")
+def metrics():
+    """Métriques au format texte Prometheus (tous les workers si METRICS_DIR est défini)"""
+    if not metrics_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/pepe")
 @login_required
 def pepe():
@@ -0,0 +1,233 @@
+# Instrumentation : compteurs/histogrammes au format texte Prometheus + logs JSON par requête
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels) + "}"
+
+
+class Registry:
+    """Métriques du processus courant, éventuellement partagées entre les workers gunicorn
+
+    Avec un répertoire partagé (METRICS_DIR), chaque worker y écrit l'état de ses métriques toutes
+    les `interval` secondes ; le worker qui répond au scrape fusionne les fichiers de tous les
+    workers : compteurs et histogrammes additionnés, jauges étiquetées par `worker` (pid),
+    comme le mode multiprocessus de prometheus_client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # nom -> {labels: valeur}
+        self._histograms = {}  # nom -> (buckets, {labels: [comptes par bucket, somme, total]})
+        self._help = {}
+        self._collectors = []  # fonctions -> [(nom, type, labels, valeur)] lues au moment de l'export
+        self.directory = None
+        self.interval = 10.0
+        self._sharing_pid = None
+
+    def counter(self, name, help_text, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, help_text, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            bounds, series = self._histograms.setdefault(name, (buckets, {}))
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [[0] * len(bounds), 0.0, 0]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collector(self, fn):
+        """Enregistrer une source de métriques calculées à l'export (pool, caches, ...)"""
+        self._collectors.append(fn)
+        return fn
+
+    def share(self, directory, interval=10.0):
+        """Partager les métriques via `directory` (à appeler avant le fork des workers)"""
+        self.directory = directory or None
+        self.interval = interval
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def start(self):
+        """Écrire l'état du processus courant à intervalle régulier (une fois par processus, après le fork)"""
+        if not self.directory or self._sharing_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sharing_pid == os.getpid():
+                return
+            self._sharing_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, name="metrics-flush", daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing metrics snapshot: {str(e)}")
+            time.sleep(self.interval)
+
+    def snapshot(self):
+        """État sérialisable en JSON : compteurs, histogrammes et valeurs des collecteurs"""
+        with self._lock:
+            snapshot = {
+                "help": dict(self._help),
+                "counters": [[name, _label_pairs(key), value]
+                             for name, series in self._counters.items() for key, value in series.items()],
+                "histograms": [[name, list(bounds), _label_pairs(key), list(counts), total, count]
+                               for name, (bounds, series) in self._histograms.items()
+                               for key, (counts, total, count) in series.items()],
+            }
+        snapshot["collected"] = [[name, metric_type, _label_pairs(tuple(sorted(labels.items()))), value]
+                                 for fn in self._collectors for name, metric_type, labels, value in fn()]
+        return snapshot
+
+    def flush(self):
+        """Écrire l'état du processus dans METRICS_DIR/worker-<pid>.json (remplacement atomique)"""
+        _write_snapshot(os.path.join(self.directory, f"worker-{os.getpid()}.json"), self.snapshot())
+
+    def _shared_snapshots(self):
+        """(pid, état) de chaque worker vivant ou mort ; l'état du processus courant est lu en direct"""
+        self.flush()
+        snapshots = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "worker-*.json"))):
+            try:
+                with open(path) as f:
+                    snapshots.append((os.path.basename(path)[7:-5], json.load(f)))
+            except (OSError, ValueError) as e:
+                print(f"Error reading metrics snapshot {path}: {str(e)}")
+        return snapshots
+
+    def render(self):
+        """Export au format texte Prometheus (version 0.0.4), tous workers confondus si METRICS_DIR est défini"""
+        if self.directory:
+            return render_snapshots(self._shared_snapshots(), label_gauges=True)
+        return render_snapshots([(str(os.getpid()), self.snapshot())], label_gauges=False)
+
+
+def _write_snapshot(path, snapshot):
+    # Fichier temporaire propre au thread : le scrape et l'écriture périodique peuvent se croiser
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def _label_pairs(key):
+    return [[k, str(v)] for k, v in key]
+
+
+def render_snapshots(snapshots, label_gauges):
+    """Fusionner des états de workers et les exporter au format texte Prometheus"""
+    help_texts = {}
+    counters = {}    # nom -> {labels: valeur}
+    histograms = {}  # nom -> (buckets, {labels: [comptes, somme, total]})
+    collected = {}   # nom -> (type, {labels: valeur})
+    for pid, snapshot in snapshots:
+        help_texts.update(snapshot["help"])
+        for name, labels, value in snapshot["counters"]:
+            series = counters.setdefault(name, {})
+            key = tuple(map(tuple, labels))
+            series[key] = series.get(key, 0) + value
+        for name, bounds, labels, counts, total, count in snapshot["histograms"]:
+            bounds, series = histograms.setdefault(name, (tuple(bounds), {}))
+            state = series.setdefault(tuple(map(tuple, labels)), [[0] * len(bounds), 0.0, 0])
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += count
+        for name, metric_type, labels, value in snapshot["collected"]:
+            if metric_type == "gauge" and label_gauges:
+                labels = labels + [["worker", pid]]
+            series = collected.setdefault(name, (metric_type, {}))[1]
+            key = tuple(sorted(map(tuple, labels)))
+            series[key] = series.get(key, 0) + value
+
+    lines = []
+    for name, series in sorted(counters.items()):
+        lines.append(f"# HELP {name} {help_texts[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{_labels_text(key)} {value}")
+    for name, (bounds, series) in sorted(histograms.items()):
+        lines.append(f"# HELP {name} {help_texts[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, (counts, total, count) in sorted(series.items()):
+            for bound, bucket_count in zip(bounds, counts):
+                lines.append(f"{name}_bucket{_labels_text(key + (('le', bound),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_labels_text(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels_text(key)} {total}")
+            lines.append(f"{name}_count{_labels_text(key)} {count}")
+    for name, (metric_type, series) in collected.items():
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{_labels_text(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def mark_process_dead(directory, pid):
+    """Worker arrêté : ses jauges disparaissent, ses compteurs et histogrammes restent dans les totaux"""
+    path = os.path.join(directory, f"worker-{pid}.json")
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    snapshot["collected"] = [item for item in snapshot["collected"] if item[1] != "gauge"]
+    _write_snapshot(path, snapshot)
+
+
+def clear_shared_metrics(directory):
+    """Vider METRICS_DIR au démarrage de gunicorn (états d'une exécution précédente)"""
+    for path in glob.glob(os.path.join(directory, "worker-*.json*")):
+        os.remove(path)
+
+
+registry = Registry()
+
+
+@contextmanager
+def timed(stage):
+    """Chronométrer une étape du chemin critique (histogramme + détail dans le log de la requête)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_stage(stage, seconds):
+    registry.observe("finker_stage_duration_seconds", "Duration of hot-path stages", seconds, stage=stage)
+    if has_request_context():
+        stages = g.setdefault("stages", {})
+        stages[stage] = round(stages.get(stage, 0.0) + seconds, 6)
+
+
+def log_event(event, **fields):
+    """Log JSON sur une ligne, avec l'identifiant de la requête courante (LOG_EVENTS=0 pour les couper)"""
+    if os.getenv("LOG_EVENTS", "1") == "0":
+        return
+    record = {"ts": round(time.time(), 3), "event": event}
+    if has_request_context() and "request_id" in g:
+        record["request_id"] = g.request_id
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
@@ -0,0 +1,115 @@
+# Migrations de schéma versionnées : fichiers migrations/NNNN_nom.sql appliqués dans l'ordre
+import json
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Verrou consultatif : un seul processus applique les migrations (plusieurs workers démarrent en même temps)
+MIGRATIONS_LOCK_ID = 7301451
+
+# Requêtes critiques, index acceptables pour chacune (vérifiées par EXPLAIN : l'un d'eux et aucun Seq Scan)
+QUERY_PLAN_CHECKS = [
+    (
+        "history page (keyset)",
+        """SELECT id, role, content, content_html, created_at FROM public.conversations_history
+           WHERE conversation_id = 1 AND id < 2147483647 ORDER BY id DESC LIMIT 51""",
+        ("idx_history_conversation_id_id",),
+    ),
+    (
+        "history since summary",
+        """SELECT id, role, content FROM public.conversations_history
+           WHERE conversation_id = 1 AND id > 0 ORDER BY id ASC""",
+        ("idx_history_conversation_id_id",),
+    ),
+    (
+        "sidebar conversations",
+        """SELECT id, title, updated_at FROM public.conversations
+           WHERE user_id = 1 ORDER BY updated_at DESC""",
+        ("idx_conversations_user_id_updated_at",),
+    ),
+    (
+        "conversation ownership",
+        "SELECT id FROM public.conversations WHERE id = 1 AND user_id = 1",
+        # Clé primaire, ou parcours index-only de l'index de la sidebar (user_id, ... INCLUDE id)
+        ("conversations_pkey", "idx_conversations_user_id_updated_at"),
+    ),
+    (
+        "login",
+        "SELECT id, password FROM public.users WHERE username = 'finker'",
+        ("users_username_key",),
+    ),
+]
+
+
+def list_migrations():
+    """[(version, nom, chemin)] triées par version"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"^(\d+)_(\w+)\.sql$", filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+def apply_migrations(conn):
+    """Appliquer les migrations en attente dans une seule transaction ; retourne celles appliquées"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS public.schema_migrations (
+               version INTEGER PRIMARY KEY,
+               name TEXT NOT NULL,
+               applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATIONS_LOCK_ID,))
+    cursor.execute("SELECT version FROM public.schema_migrations")
+    done = {row[0] for row in cursor.fetchall()}
+
+    applied = []
+    for version, name, path in list_migrations():
+        if version in done:
+            continue
+        with open(path, encoding="utf-8") as f:
+            cursor.execute(f.read())
+        cursor.execute("INSERT INTO public.schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        applied.append((version, name))
+    conn.commit()
+    cursor.close()
+    return applied
+
+
+def _plan_nodes(plan):
+    """Nœuds d'un plan EXPLAIN (FORMAT JSON), à toutes les profondeurs"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def check_query_plans(conn):
+    """Vérifier que chaque requête critique passe par un de ses index acceptables, sans Seq Scan
+
+    Les parcours séquentiels sont désactivés le temps de la vérification : sur une base
+    locale presque vide, le planificateur les préférerait même avec le bon index.
+    """
+    results = []
+    cursor = conn.cursor()
+    cursor.execute("SET LOCAL enable_seqscan = off")
+    for name, query, expected_indexes in QUERY_PLAN_CHECKS:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = list(_plan_nodes(plan[0]["Plan"]))
+        used = {node["Index Name"] for node in nodes if "Index Name" in node}
+        seq_scan = any(node["Node Type"] == "Seq Scan" for node in nodes)
+        results.append({
+            "name": name,
+            "expected": list(expected_indexes),
+            "used": sorted(used),
+            "seq_scan": seq_scan,
+            "ok": bool(used & set(expected_indexes)) and not seq_scan,
+        })
+    cursor.close()
+    conn.rollback()
+    return results
@@ -0,0 +1,13 @@
+-- supabase_schema.sql créait `password_hash` alors que main.py lit/écrit `password`
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_schema = 'public' AND table_name = 'users' AND column_name = 'password_hash')
+       AND NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = 'public' AND table_name = 'users' AND column_name = 'password') THEN
+        ALTER TABLE public.users RENAME COLUMN password_hash TO password;
+    END IF;
+END $$;
+
+-- Titre par défaut identique à celui utilisé par l'application
+ALTER TABLE public.conversations ALTER COLUMN title SET DEFAULT 'Nouvelle conversation';
@@ -0,0 +1,10 @@
+-- Résumé glissant des anciens échanges (fenêtre de contexte bornée)
+CREATE TABLE IF NOT EXISTS public.conversation_summaries (
+    conversation_id INTEGER PRIMARY KEY REFERENCES public.conversations(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_until_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Réponse assistant pré-rendue (Markdown -> HTML) à l'écriture
+ALTER TABLE public.conversations_history ADD COLUMN IF NOT EXISTS content_html TEXT;
@@ -0,0 +1,19 @@
+-- Index composites alignés sur les requêtes réelles
+
+-- Historique : WHERE conversation_id = ? [AND id < ? | id > ?] ORDER BY id
+CREATE INDEX IF NOT EXISTS idx_history_conversation_id_id
+    ON public.conversations_history (conversation_id, id);
+
+-- Sidebar : WHERE user_id = ? ORDER BY updated_at DESC, couvrant (index-only scan)
+CREATE INDEX IF NOT EXISTS idx_conversations_user_id_updated_at
+    ON public.conversations (user_id, updated_at DESC) INCLUDE (id, title);
+
+-- Suppression d'un utilisateur (ON DELETE CASCADE sur conversations_history.user_id)
+CREATE INDEX IF NOT EXISTS idx_history_user_id
+    ON public.conversations_history (user_id);
+
+-- Index mono-colonne devenus redondants (préfixes des index ci-dessus) ou jamais utilisés
+DROP INDEX IF EXISTS public.idx_conversations_user_id;
+DROP INDEX IF EXISTS public.idx_conversations_updated_at;
+DROP INDEX IF EXISTS public.idx_history_conversation_id;
+DROP INDEX IF EXISTS public.idx_history_created_at;
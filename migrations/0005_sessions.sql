@@ -0,0 +1,8 @@
+-- Sessions serveur partagées entre workers/dynos (SESSION_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS public.sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON public.sessions (expires_at);
@@ -0,0 +1,12 @@
+-- Cache partagé des réponses aux questions récurrentes (RESPONSE_CACHE_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS public.response_cache (
+    key VARCHAR(64) PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at ON public.response_cache (expires_at);
+
+-- Opt-out par conversation
+ALTER TABLE public.conversations ADD COLUMN IF NOT EXISTS response_cache_enabled BOOLEAN NOT NULL DEFAULT TRUE;
@@ -0,0 +1,20 @@
+-- File de tâches de fond (rendu HTML, titres, résumés), consommée avec FOR UPDATE SKIP LOCKED
+CREATE TABLE IF NOT EXISTS public.jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    dedupe_key VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Prochaine tâche à exécuter
+CREATE INDEX IF NOT EXISTS idx_jobs_pending_run_at ON public.jobs (run_at) WHERE status = 'pending';
+-- Tâches bloquées par un worker arrêté en cours d'exécution
+CREATE INDEX IF NOT EXISTS idx_jobs_running_locked_at ON public.jobs (locked_at) WHERE status = 'running';
+-- Au plus une tâche en attente par clé (ex. un seul résumé en attente par conversation)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_pending_dedupe_key ON public.jobs (dedupe_key) WHERE status = 'pending';
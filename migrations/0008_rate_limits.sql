@@ -0,0 +1,6 @@
+-- Limites de débit partagées entre workers (RATE_LIMIT_BACKEND=postgres)
+-- tat : instant théorique d'arrivée de la prochaine requête (secondes epoch, algorithme GCRA)
+CREATE TABLE IF NOT EXISTS public.rate_limits (
+    key VARCHAR(255) PRIMARY KEY,
+    tat DOUBLE PRECISION NOT NULL
+);
@@ -0,0 +1,8 @@
+-- Recherche plein texte dans l'historique (configuration française : racines, mots vides)
+-- Colonne générée : maintenue par PostgreSQL à chaque INSERT/UPDATE, sans code applicatif.
+-- L'ajout réécrit la table une fois (à prévoir hors des heures de pointe sur un gros historique).
+ALTER TABLE public.conversations_history
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('french', content)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_history_content_tsv ON public.conversations_history USING GIN (content_tsv);
@@ -0,0 +1,13 @@
+-- Embeddings des messages (CONTEXT_MODE=retrieval), calculés par la tâche de fond embed_messages
+-- embedding : float32 petit-boutiste en bytea (4 octets par dimension), lu par np.frombuffer ;
+-- model : "<modèle>:<dimensions>". La similarité est calculée côté application (NumPy).
+CREATE TABLE IF NOT EXISTS public.message_embeddings (
+    message_id INTEGER PRIMARY KEY REFERENCES public.conversations_history(id) ON DELETE CASCADE,
+    conversation_id INTEGER NOT NULL REFERENCES public.conversations(id) ON DELETE CASCADE,
+    model VARCHAR(100) NOT NULL,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tous les vecteurs d'une conversation, par id de message
+CREATE INDEX IF NOT EXISTS idx_message_embeddings_conversation_id ON public.message_embeddings (conversation_id, message_id);
@@ -0,0 +1,7 @@
+-- Identifiant de tour (UUID généré par l'application) : un tour rejoué après une erreur de
+-- connexion ou par la tâche save_turn n'insère pas ses messages une seconde fois.
+-- NULL pour les messages antérieurs et importés.
+ALTER TABLE public.conversations_history ADD COLUMN IF NOT EXISTS turn_id UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_history_turn_id_role ON public.conversations_history (turn_id, role)
+    WHERE turn_id IS NOT NULL;
@@ -0,0 +1,90 @@
+# Hachage des mots de passe dans un pool borné, hors de la boucle des requêtes (scrypt/pbkdf2 coûtent des dizaines de ms CPU)
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import registry
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+class PasswordHasher:
+    """Hachage et vérification exécutés par au plus `workers` threads (ou processus) par worker web
+
+    hashlib libère le GIL pendant scrypt/pbkdf2 : des threads suffisent à occuper plusieurs cœurs.
+    Sous gevent, les threads « monkey-patchés » seraient des greenlets qui bloqueraient la boucle :
+    on passe alors par un ThreadPool gevent (vrais threads, le greenlet appelant attend sans bloquer).
+    Au-delà de `workers` calculs simultanés, les requêtes attendent leur tour au lieu de saturer le CPU.
+    """
+
+    def __init__(self, method="scrypt", salt_length=16, workers=2, executor="thread"):
+        if executor not in ("thread", "process"):
+            raise RuntimeError(f"Unknown PASSWORD_HASH_EXECUTOR: {executor}")
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.executor = executor
+        # Préfixe canonique des hachages produits avec ces paramètres (ex. "scrypt:32768:8:1")
+        self.prefix = generate_password_hash("", method=method, salt_length=salt_length).split("$", 1)[0]
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            method=os.getenv("PASSWORD_HASH_METHOD", "scrypt"),
+            salt_length=int(os.getenv("PASSWORD_SALT_LENGTH", "16")),
+            workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+            executor=os.getenv("PASSWORD_HASH_EXECUTOR", "thread"),
+        )
+
+    def _get_pool(self):
+        """Pool créé au premier appel dans chaque processus (après le fork de gunicorn)"""
+        if self._pool_pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pool_pid != os.getpid():
+                if _gevent_patched():
+                    if self.executor == "process":
+                        print("PASSWORD_HASH_EXECUTOR=process is not supported under gevent, using threads")
+                    from gevent.threadpool import ThreadPool
+                    self._pool = ThreadPool(self.workers)
+                elif self.executor == "process":
+                    self._pool = ProcessPoolExecutor(self.workers)
+                else:
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+                self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, operation, fn, *args):
+        started = time.perf_counter()
+        pool = self._get_pool()
+        if isinstance(pool, (ThreadPoolExecutor, ProcessPoolExecutor)):
+            result = pool.submit(fn, *args).result()
+        else:
+            result = pool.apply(fn, args)
+        registry.observe("finker_password_hash_seconds", "Password hashing time, queue wait included",
+                         time.perf_counter() - started, operation=operation)
+        return result
+
+    def hash(self, password):
+        return self._run("hash", generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run("verify", check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Hachage produit avec d'autres paramètres (méthode, coût, longueur du sel) que ceux configurés"""
+        prefix, _, rest = password_hash.partition("$")
+        salt = rest.partition("$")[0]
+        return prefix != self.prefix or len(salt) != self.salt_length
@@ -0,0 +1,116 @@
+# Cache des réponses aux questions récurrentes (premiers tours de conversation)
+import os
+import random
+import re
+import threading
+import unicodedata
+
+from helpers import LRUCache, content_hash
+
+
+def normalize_prompt(text):
+    """Rapprocher les formulations quasi identiques : casse, accents, espaces et ponctuation finale
+
+    Les autres symboles restent dans la clé : « C++ » et « C », « 2+2 » et « 2-2 » diffèrent.
+    """
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = " ".join(text.split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+
+class ResponseCache:
+    """Cache en mémoire (LRU + TTL) par worker, doublé d'une table PostgreSQL partagée optionnelle"""
+
+    def __init__(self, get_db=None, enabled=True, maxsize=1024, ttl=86400, max_history=0, shared=False,
+                 cleanup_probability=0.01):
+        self.get_db = get_db
+        self.enabled = enabled
+        self.cleanup_probability = cleanup_probability
+        self.ttl = ttl
+        self.max_history = max_history
+        self.shared = shared and get_db is not None
+        self._local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @classmethod
+    def from_env(cls, get_db):
+        return cls(
+            get_db=get_db,
+            enabled=os.getenv("RESPONSE_CACHE", "1") == "1",
+            maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+            ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+            max_history=int(os.getenv("RESPONSE_CACHE_MAX_HISTORY", "0")),
+            shared=os.getenv("RESPONSE_CACHE_BACKEND", "memory") == "postgres",
+        )
+
+    def key_for(self, user_message, conversation_history, summary, model, system_prompt):
+        """Clé du tour, ou None si le tour n'est pas cachable (cache désactivé, historique trop long ou résumé)"""
+        if not self.enabled or summary or len(conversation_history) > self.max_history:
+            return None
+        parts = [model, content_hash(system_prompt)]
+        parts += [f"{msg['role']}:{normalize_prompt(msg['content'])}" for msg in conversation_history]
+        parts.append(normalize_prompt(user_message))
+        return content_hash("\x1f".join(parts))
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        response = self._local.get(key)
+        if response is not None:
+            self._count("hits")
+            return response
+        if self.shared:
+            try:
+                with self.get_db(autocommit=True) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(
+                        "SELECT response FROM public.response_cache WHERE key=%s AND expires_at > CURRENT_TIMESTAMP",
+                        (key,)
+                    )
+                    row = cursor.fetchone()
+                    cursor.close()
+                if row:
+                    self._local.set(key, row[0])
+                    self._count("hits")
+                    self._count("shared_hits")
+                    return row[0]
+            except Exception as e:
+                print(f"Error reading response cache: {str(e)}")
+        self._count("misses")
+        return None
+
+    def set(self, key, response):
+        self._local.set(key, response)
+        self._count("stores")
+        if self.shared:
+            try:
+                with self.get_db(autocommit=True) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(
+                        """INSERT INTO public.response_cache (key, response, expires_at)
+                           VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                           ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, expires_at = EXCLUDED.expires_at""",
+                        (key, response, self.ttl)
+                    )
+                    if random.random() < self.cleanup_probability:
+                        cursor.execute("DELETE FROM public.response_cache WHERE expires_at < CURRENT_TIMESTAMP")
+                    cursor.close()
+            except Exception as e:
+                print(f"Error writing response cache: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "size": len(self._local),
+            }
@@ -0,0 +1,169 @@
+# Récupération sémantique (CONTEXT_MODE=retrieval) : échanges anciens les plus proches de la question courante
+import os
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+from helpers import LRUCache
+
+# Texte envoyé au modèle d'embedding (au-delà, la fin du message est ignorée)
+EMBED_MAX_CHARS = 8000
+
+
+def top_k_similar(matrix, query, k, min_score=0.0):
+    """[(indice de ligne, score)] des `k` lignes de `matrix` les plus proches de `query` (cosinus), score décroissant"""
+    if not len(matrix) or k <= 0:
+        return []
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1.0
+    scores = (matrix @ query) / (norms * (np.linalg.norm(query) or 1.0))
+    k = min(k, len(scores))
+    # Sélection partielle O(n), puis tri des k gagnants seulement
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(i), float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+def to_bytes(vector):
+    """Vecteur -> bytea (float32 petit-boutiste, 4 octets par dimension)"""
+    return psycopg2.Binary(np.asarray(vector, dtype="<f4").tobytes())
+
+
+class Retriever:
+    """Embeddings des messages (calculés en tâche de fond) et sélection des échanges pertinents
+
+    Les vecteurs d'une conversation sont gardés en mémoire (matrice NumPy, LRU par conversation) :
+    à chaque tour, une requête ne lit que ceux ajoutés depuis (id > dernier id en cache), décodés
+    par np.frombuffer sans passer par des listes Python. Un appel vectorise la question, un
+    produit matrice-vecteur donne les scores ; chaque message retenu est complété par l'autre
+    moitié de son échange (question ↔ réponse).
+    """
+
+    def __init__(self, get_db, gateway, top_k=4, min_score=0.3, batch_size=100, cache_size=64):
+        self.get_db = get_db
+        self.gateway = gateway
+        self.top_k = top_k
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self.dimensions = gateway.embedding_dimensions
+        # Des vecteurs d'un autre modèle ou d'une autre dimension sont recalculés
+        self.model_key = f"{gateway.embedding_model}:{gateway.embedding_dimensions}"
+        self._matrices = LRUCache(maxsize=cache_size)  # conversation_id -> (ids triés, matrice float32)
+
+    @classmethod
+    def from_env(cls, get_db, gateway):
+        return cls(
+            get_db,
+            gateway,
+            top_k=int(os.getenv("CONTEXT_RETRIEVAL_TOP_K", "4")),
+            min_score=float(os.getenv("CONTEXT_RETRIEVAL_MIN_SCORE", "0.3")),
+            cache_size=int(os.getenv("CONTEXT_RETRIEVAL_CACHE_SIZE", "64")),
+        )
+
+    def embed_missing(self, conversation_id):
+        """Vectoriser les messages de la conversation sans embedding du modèle courant, par lots ; retourne le nombre traité"""
+        model = self.model_key
+        total = 0
+        while True:
+            with self.get_db(autocommit=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """SELECT h.id, h.content
+                       FROM public.conversations_history h
+                       LEFT JOIN public.message_embeddings e ON e.message_id = h.id AND e.model = %s
+                       WHERE h.conversation_id = %s AND e.message_id IS NULL
+                       ORDER BY h.id
+                       LIMIT %s""",
+                    (model, conversation_id, self.batch_size)
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+            if not rows:
+                return total
+            vectors = self.gateway.embed([content[:EMBED_MAX_CHARS] for _, content in rows])
+            with self.get_db(autocommit=True) as conn:
+                cursor = conn.cursor()
+                execute_values(
+                    cursor,
+                    """INSERT INTO public.message_embeddings (message_id, conversation_id, model, embedding)
+                       VALUES %s
+                       ON CONFLICT (message_id) DO UPDATE
+                       SET model = EXCLUDED.model, embedding = EXCLUDED.embedding, created_at = CURRENT_TIMESTAMP""",
+                    [(message_id, conversation_id, model, to_bytes(vector)) for (message_id, _), vector in zip(rows, vectors)],
+                )
+                cursor.close()
+            total += len(rows)
+            if len(rows) < self.batch_size:
+                return total
+
+    def _vectors(self, conversation_id):
+        """(ids triés, matrice float32) de la conversation : cache complété des vecteurs ajoutés depuis"""
+        cached = self._matrices.get(conversation_id)
+        if cached is None:
+            cached = (np.empty(0, dtype=np.int64), np.empty((0, self.dimensions), dtype=np.float32))
+        ids, matrix = cached
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT message_id, embedding FROM public.message_embeddings
+                   WHERE conversation_id = %s AND model = %s AND message_id > %s
+                   ORDER BY message_id""",
+                (conversation_id, self.model_key, int(ids[-1]) if len(ids) else 0)
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+        if rows:
+            new_vectors = np.frombuffer(b"".join(bytes(embedding) for _, embedding in rows), dtype="<f4")
+            ids = np.concatenate([ids, np.fromiter((message_id for message_id, _ in rows), dtype=np.int64)])
+            matrix = np.concatenate([matrix, new_vectors.reshape(len(rows), self.dimensions)])
+            self._matrices.set(conversation_id, (ids, matrix))
+        return ids, matrix
+
+    def relevant_turns(self, conversation_id, query, before_id):
+        """Échanges [question, réponse] antérieurs au message `before_id`, du plus au moins pertinent
+
+        None si aucun message antérieur n'a encore d'embedding : le contexte retombe alors sur
+        les derniers messages dans le budget, comme sans récupération.
+        """
+        all_ids, all_vectors = self._vectors(conversation_id)
+        # Seulement les messages antérieurs à la fenêtre récente (ids triés)
+        count = int(np.searchsorted(all_ids, before_id))
+        if not count:
+            return None
+        ids = all_ids[:count].tolist()
+        matrix = all_vectors[:count]
+        query_vector = self.gateway.embed([query[:EMBED_MAX_CHARS]], task_type="RETRIEVAL_QUERY",
+                                          timeout=self.gateway.embedding_timeout)[0]
+        hits = top_k_similar(matrix, np.asarray(query_vector, dtype=np.float32), self.top_k, self.min_score)
+        if not hits:
+            return []
+
+        # Messages retenus + leurs voisins immédiats (l'autre moitié de l'échange), en une requête
+        wanted = set()
+        for i, _ in hits:
+            wanted.update(ids[max(i - 1, 0):i + 2])
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, role, content FROM public.conversations_history WHERE conversation_id = %s AND id = ANY(%s)",
+                (conversation_id, sorted(wanted))
+            )
+            messages = {row[0]: {"id": row[0], "role": row[1], "content": row[2]} for row in cursor.fetchall()}
+            cursor.close()
+
+        turns = []
+        seen = set()
+        for i, _ in hits:
+            message = messages.get(ids[i])
+            if message is None or message["id"] in seen:
+                continue
+            # Une question est suivie de sa réponse ; une réponse suit sa question
+            j = i + 1 if message["role"] == "user" else i - 1
+            partner = messages.get(ids[j]) if 0 <= j < len(ids) else None
+            turn = [message]
+            if partner is not None and partner["role"] != message["role"] and partner["id"] not in seen:
+                turn = sorted([message, partner], key=lambda m: m["id"])
+            seen.update(m["id"] for m in turn)
+            turns.append(turn)
+        return turns
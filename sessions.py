@@ -0,0 +1,158 @@
+# Backends de session : cookie signé (défaut), PostgreSQL ou Redis partagés entre workers/dynos
+import os
+import random
+import secrets
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_session import Session
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dont seul l'identifiant voyage dans le cookie"""
+
+    def __init__(self, initial=None, sid=None, new=False, expires_in=None):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.expires_in = expires_in  # secondes restantes avant expiration côté serveur
+        self.loaded_user_id = self.get("user_id")  # utilisateur au chargement (rotation de l'id au login)
+
+
+class PostgresSessionInterface(SessionInterface):
+    """Sessions stockées dans public.sessions (une lecture par requête, une écriture seulement si modifiée)"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, get_db, cleanup_probability=0.01):
+        self.get_db = get_db
+        self.cleanup_probability = cleanup_probability
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            with self.get_db(autocommit=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """SELECT data, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP)
+                       FROM public.sessions WHERE id=%s AND expires_at > CURRENT_TIMESTAMP""",
+                    (sid,)
+                )
+                row = cursor.fetchone()
+                cursor.close()
+            if row:
+                return ServerSideSession(self.serializer.loads(row[0]), sid=sid, expires_in=float(row[1]))
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        """Nouvel identifiant pour la session (même API que Flask-Session) ; l'ancienne ligne est supprimée"""
+        if session.new:
+            return
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM public.sessions WHERE id=%s", (session.sid,))
+            cursor.close()
+        session.sid = secrets.token_urlsafe(32)
+        session.loaded_user_id = session.get("user_id")
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+
+        if not session:
+            if session.modified and not session.new:
+                # Déconnexion : supprimer la ligne et le cookie
+                with self.get_db(autocommit=True) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("DELETE FROM public.sessions WHERE id=%s", (session.sid,))
+                    cursor.close()
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # Prolonger une session active seulement quand la moitié de sa durée est écoulée
+        if not session.modified and session.expires_in is not None and session.expires_in > lifetime / 2:
+            return
+
+        # Changement d'utilisateur (login) : nouvel identifiant, l'ancien est supprimé. Un identifiant
+        # imposé à la victime avant sa connexion (fixation de session) ne devient jamais authentifié.
+        previous_sid = None
+        if not session.new and session.get("user_id") != session.loaded_user_id:
+            previous_sid = session.sid
+            session.sid = secrets.token_urlsafe(32)
+            session.loaded_user_id = session.get("user_id")
+
+        with self.get_db(autocommit=True) as conn:
+            cursor = conn.cursor()
+            if previous_sid:
+                cursor.execute("DELETE FROM public.sessions WHERE id=%s", (previous_sid,))
+            cursor.execute(
+                """INSERT INTO public.sessions (id, data, expires_at)
+                   VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                   ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at""",
+                (session.sid, self.serializer.dumps(dict(session)), lifetime)
+            )
+            if random.random() < self.cleanup_probability:
+                cursor.execute("DELETE FROM public.sessions WHERE expires_at < CURRENT_TIMESTAMP")
+            cursor.close()
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def rotate_session(app, session):
+    """Changer l'identifiant de la session au login (fixation de session) pour les backends serveur
+
+    Le cookie signé par défaut n'a pas d'identifiant : vider la session avant d'y écrire user_id suffit.
+    """
+    regenerate = getattr(app.session_interface, "regenerate", None)
+    if regenerate is not None:
+        regenerate(session)
+
+
+def delete_expired_sessions(get_db):
+    """Purger les sessions PostgreSQL expirées ; retourne le nombre de lignes supprimées"""
+    with get_db(autocommit=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM public.sessions WHERE expires_at < CURRENT_TIMESTAMP")
+        deleted = cursor.rowcount
+        cursor.close()
+    return deleted
+
+
+def init_session(app, get_db):
+    """Choisir le backend de session selon SESSION_BACKEND"""
+    backend = os.getenv("SESSION_BACKEND", "cookie")
+    if backend == "cookie":
+        # Session Flask par défaut : cookie signé, aucune E/S côté serveur (le contenu se limite à user_id)
+        return
+    if backend == "postgres":
+        app.session_interface = PostgresSessionInterface(get_db)
+        return
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)")
+        app.config["SESSION_TYPE"] = "redis"
+        app.config["SESSION_REDIS"] = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    elif backend == "filesystem":
+        app.config["SESSION_TYPE"] = "filesystem"
+    else:
+        raise RuntimeError(f"Unknown SESSION_BACKEND: {backend}")
+    Session(app)
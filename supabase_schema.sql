@@ -1,11 +1,13 @@
 -- 🗄️ Schema Finker AI - PostgreSQL/Supabase
--- Exécutez ce script dans Supabase SQL Editor
+-- Instantané du schéma courant. La source de vérité est migrations/ :
+--     flask --app main db-upgrade
+-- (à préférer à ce script, qui ne sait pas faire évoluer une base existante)
 
 -- 1️⃣ Table des utilisateurs
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     username VARCHAR(255) UNIQUE NOT NULL,
-    password_hash VARCHAR(255) NOT NULL,
+    password VARCHAR(255) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -13,7 +15,8 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE TABLE IF NOT EXISTS conversations (
     id SERIAL PRIMARY KEY,
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    title VARCHAR(500) DEFAULT 'New Conversation',
+    title VARCHAR(500) DEFAULT 'Nouvelle conversation',
+    response_cache_enabled BOOLEAN NOT NULL DEFAULT TRUE,  -- opt-out du cache de réponses
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -25,14 +28,76 @@ CREATE TABLE IF NOT EXISTS conversations_history (
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     role VARCHAR(50) NOT NULL CHECK (role IN ('user', 'assistant')),
     content TEXT NOT NULL,
+    content_html TEXT,  -- réponse assistant pré-rendue (Markdown -> HTML) à l'écriture
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('french', content)) STORED,  -- recherche plein texte
+    turn_id UUID,  -- identifiant du tour : un tour rejoué n'est pas inséré deux fois
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- 4️⃣ Index pour optimiser les performances
-CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
-CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations(updated_at DESC);
-CREATE INDEX IF NOT EXISTS idx_history_conversation_id ON conversations_history(conversation_id);
-CREATE INDEX IF NOT EXISTS idx_history_created_at ON conversations_history(created_at);
+-- 4️⃣ Résumé glissant des anciens échanges (fenêtre de contexte bornée)
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    conversation_id INTEGER PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_until_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 5️⃣ Sessions serveur (SESSION_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- 6️⃣ Cache partagé des réponses (RESPONSE_CACHE_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS response_cache (
+    key VARCHAR(64) PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- 7️⃣ File de tâches de fond (rendu HTML, titres, résumés)
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    dedupe_key VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 8️⃣ Limites de débit partagées (RATE_LIMIT_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key VARCHAR(255) PRIMARY KEY,
+    tat DOUBLE PRECISION NOT NULL
+);
+
+-- 🔟 Embeddings des messages (CONTEXT_MODE=retrieval)
+CREATE TABLE IF NOT EXISTS message_embeddings (
+    message_id INTEGER PRIMARY KEY REFERENCES conversations_history(id) ON DELETE CASCADE,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    model VARCHAR(100) NOT NULL,
+    embedding BYTEA NOT NULL,  -- float32 petit-boutiste
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 9️⃣ Index alignés sur les requêtes (voir migrations/0004_access_path_indexes.sql)
+CREATE INDEX IF NOT EXISTS idx_history_conversation_id_id ON conversations_history(conversation_id, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_user_id_updated_at ON conversations(user_id, updated_at DESC) INCLUDE (id, title);
+CREATE INDEX IF NOT EXISTS idx_history_user_id ON conversations_history(user_id);
+CREATE INDEX IF NOT EXISTS idx_history_content_tsv ON conversations_history USING GIN (content_tsv);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_history_turn_id_role ON conversations_history(turn_id, role) WHERE turn_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at ON response_cache(expires_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_pending_run_at ON jobs(run_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_jobs_running_locked_at ON jobs(locked_at) WHERE status = 'running';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_pending_dedupe_key ON jobs(dedupe_key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_message_embeddings_conversation_id ON message_embeddings(conversation_id, message_id);
 
 -- ✅ Vérification des tables
 SELECT 
@@ -41,5 +106,5 @@ SELECT
 FROM information_schema.tables t
 WHERE table_schema = 'public' 
     AND table_type = 'BASE TABLE'
-    AND table_name IN ('users', 'conversations', 'conversations_history')
+    AND table_name IN ('users', 'conversations', 'conversations_history', 'conversation_summaries')
 ORDER BY table_name;
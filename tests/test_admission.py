@@ -0,0 +1,116 @@
+# Admission de /search : seau à jetons (GCRA) en mémoire et file d'attente des appels au modèle
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import AdmissionControl, AdmissionRejected, MemoryRateLimitStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def test_take_admits_a_burst_then_reports_the_wait(clock):
+    store = MemoryRateLimitStore()
+    # 1 jeton toutes les 3 s, rafale de 5
+    assert [store.take("u1", 3.0, 15.0) for _ in range(5)] == [0.0] * 5
+    assert store.take("u1", 3.0, 15.0) == pytest.approx(3.0)
+    clock.now += 1.0
+    assert store.take("u1", 3.0, 15.0) == pytest.approx(2.0)
+
+
+def test_take_refills_one_token_per_interval(clock):
+    store = MemoryRateLimitStore()
+    for _ in range(5):
+        store.take("u1", 3.0, 15.0)
+    clock.now += 3.0
+    assert store.take("u1", 3.0, 15.0) == 0.0
+    assert store.take("u1", 3.0, 15.0) > 0
+    # Une longue inactivité ne crédite pas plus que la rafale
+    clock.now += 3600.0
+    assert [store.take("u1", 3.0, 15.0) for _ in range(6)].count(0.0) == 5
+
+
+def test_take_keys_are_independent(clock):
+    store = MemoryRateLimitStore()
+    store.take("u1", 60.0, 60.0)
+    assert store.take("u1", 60.0, 60.0) > 0
+    assert store.take("u2", 60.0, 60.0) == 0.0
+
+
+def test_take_evicts_expired_keys_beyond_max_keys(clock):
+    store = MemoryRateLimitStore(max_keys=2)
+    store.take("u1", 1.0, 1.0)
+    store.take("u2", 1.0, 1.0)
+    clock.now += 10.0
+    store.take("u3", 1.0, 1.0)
+    assert set(store._tats) == {"u3"}
+
+
+def test_check_rate_raises_rate_limited(clock):
+    control = AdmissionControl(MemoryRateLimitStore(), rate_per_minute=60, burst=2)
+    control.check_rate("u1")
+    control.check_rate("u1")
+    with pytest.raises(AdmissionRejected) as excinfo:
+        control.check_rate("u1")
+    assert excinfo.value.reason == "rate_limited"
+    assert excinfo.value.retry_after == pytest.approx(1.0)
+
+
+def test_check_rate_disabled_with_zero_rate():
+    control = AdmissionControl(MemoryRateLimitStore(), rate_per_minute=0)
+    for _ in range(100):
+        control.check_rate("u1")
+
+
+def test_acquire_rejects_when_the_queue_is_full():
+    control = AdmissionControl(MemoryRateLimitStore(), max_in_flight=1, max_queue=0)
+    assert control.acquire() == 0.0
+    with pytest.raises(AdmissionRejected) as excinfo:
+        control.acquire()
+    assert excinfo.value.reason == "queue_full"
+    control.release()
+    assert control.acquire() == 0.0
+
+
+def test_acquire_times_out_in_the_queue():
+    control = AdmissionControl(MemoryRateLimitStore(), max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    control.acquire()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        control.acquire()
+    assert excinfo.value.reason == "queue_timeout"
+    assert control.stats() == {"in_flight": 1, "waiting": 0}
+
+
+def test_release_admits_a_waiting_request():
+    control = AdmissionControl(MemoryRateLimitStore(), max_in_flight=1, max_queue=1, queue_timeout=5)
+    control.acquire()
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(control.acquire()))
+    waiter.start()
+    while control.stats()["waiting"] == 0:
+        time.sleep(0.001)
+    control.release()
+    waiter.join(5)
+    assert len(waited) == 1 and waited[0] >= 0
+    assert control.stats() == {"in_flight": 1, "waiting": 0}
+
+
+def test_acquire_unbounded_when_max_in_flight_is_zero():
+    control = AdmissionControl(MemoryRateLimitStore(), max_in_flight=0)
+    assert [control.acquire() for _ in range(10)] == [0.0] * 10
+    control.release()
+    assert control.stats() == {"in_flight": 0, "waiting": 0}
@@ -0,0 +1,162 @@
+# Passerelle modèle : disjoncteur, nouveaux essais et repli (faux client bench.stub_model, sans réseau)
+import pytest
+from google.genai import errors
+
+import gateway
+from bench.stub_model import StubClient
+from gateway import CircuitBreaker, ModelGateway, ModelUnavailable
+
+
+def overloaded():
+    return errors.ServerError(503, {"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}})
+
+
+def bad_request():
+    return errors.ClientError(400, {"error": {"code": 400, "message": "bad request", "status": "INVALID_ARGUMENT"}})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gateway.time, "monotonic", clock)
+    monkeypatch.setattr(gateway.time, "sleep", lambda seconds: None)
+    return clock
+
+
+@pytest.fixture
+def stub_env(monkeypatch):
+    for name, value in {"STUB_FIRST_CHUNK_MS": "0", "STUB_CHUNK_DELAY_MS": "0", "STUB_CHUNKS": "3",
+                        "STUB_CHUNK_SIZE": "10", "STUB_FAILURE_RATE": "0", "STUB_FAILING_MODELS": ""}.items():
+        monkeypatch.setenv(name, value)
+    return monkeypatch
+
+
+def make_gateway(**kwargs):
+    options = {"api_key": "test", "model": "primary", "fallback_models": ["fallback"], "client_factory": StubClient,
+               "max_retries": 2, "backoff_base": 0, "breaker_threshold": 3, "breaker_reset": 30.0}
+    options.update(kwargs)
+    return ModelGateway(**options)
+
+
+def failing(times, error=overloaded):
+    """request(modèle) qui échoue `times` fois puis renvoie le modèle appelé"""
+    calls = []
+
+    def request(model):
+        calls.append(model)
+        if len(calls) <= times:
+            raise error()
+        return f"ok from {model}"
+
+    return request, calls
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(10.0)
+
+
+def test_breaker_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0)
+    breaker.record_failure()
+    clock.now += 10.0
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10.0)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 10.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.retry_after() == pytest.approx(10.0)
+
+
+def test_call_retries_transient_errors(clock):
+    gw = make_gateway()
+    request, calls = failing(2)
+    stats = {}
+    assert gw._call(request, stats) == ("primary", "ok from primary")
+    assert calls == ["primary"] * 3
+    assert stats["retries"] == 2
+    assert gw.breakers["primary"].state == "closed"
+
+
+def test_call_falls_back_after_retries(clock):
+    gw = make_gateway()
+    request, calls = failing(3)
+    assert gw._call(request) == ("fallback", "ok from fallback")
+    assert calls == ["primary"] * 3 + ["fallback"]
+
+
+def test_call_skips_a_model_whose_breaker_is_open(clock):
+    gw = make_gateway()
+    for _ in range(3):
+        gw.breakers["primary"].record_failure()
+    request, calls = failing(0)
+    assert gw._call(request) == ("fallback", "ok from fallback")
+    assert calls == ["fallback"]
+
+
+def test_call_does_not_retry_request_errors(clock):
+    gw = make_gateway()
+    request, calls = failing(1, error=bad_request)
+    with pytest.raises(errors.ClientError):
+        gw._call(request)
+    assert calls == ["primary"]
+    assert gw.breakers["primary"].state == "closed"
+
+
+def test_call_raises_model_unavailable_when_every_model_fails(clock):
+    gw = make_gateway(max_retries=0, breaker_threshold=1)
+    request, calls = failing(10)
+    with pytest.raises(ModelUnavailable) as excinfo:
+        gw._call(request)
+    assert calls == ["primary", "fallback"]
+    assert excinfo.value.retry_after == pytest.approx(30.0)
+    # Disjoncteurs ouverts : plus aucun appel
+    with pytest.raises(ModelUnavailable):
+        gw._call(request)
+    assert calls == ["primary", "fallback"]
+
+
+def test_call_stops_at_the_deadline(clock):
+    gw = make_gateway()
+
+    def slow(model):
+        clock.now += 60.0
+        raise overloaded()
+
+    with pytest.raises(ModelUnavailable) as excinfo:
+        gw._call(slow, deadline=clock.now + 30.0)
+    assert "deadline" in str(excinfo.value)
+
+
+def test_stream_falls_back_with_the_stub_backend(clock, stub_env):
+    stub_env.setenv("STUB_FAILING_MODELS", "primary")
+    gw = make_gateway()
+    stats = {}
+    text = "".join(gw.stream("Bonjour", [], stats=stats))
+    assert len(text) == 30
+    assert stats["model"] == "fallback"
+    assert stats["chunks"] == 3
+    assert stats["retries"] == 3
@@ -0,0 +1,36 @@
+# Fusion des métriques des workers via METRICS_DIR
+from metrics import Registry, mark_process_dead, render_snapshots
+
+
+def worker_registry(requests, pool_size):
+    registry = Registry()
+    registry.counter("finker_requests_total", "HTTP requests", requests, route="/", status=200)
+    registry.observe("finker_request_duration_seconds", "HTTP request latency", 0.02, route="/")
+    registry.collector(lambda: [("finker_db_pool_size", "gauge", {}, pool_size)])
+    return registry
+
+
+def test_counters_and_histograms_are_summed_gauges_labeled_by_worker():
+    text = render_snapshots([("1", worker_registry(3, 2).snapshot()), ("2", worker_registry(4, 5).snapshot())],
+                            label_gauges=True)
+    assert 'finker_requests_total{route="/",status="200"} 7' in text
+    assert 'finker_request_duration_seconds_count{route="/"} 2' in text
+    assert 'finker_request_duration_seconds_bucket{route="/",le="0.025"} 2' in text
+    assert 'finker_db_pool_size{worker="1"} 2' in text
+    assert 'finker_db_pool_size{worker="2"} 5' in text
+
+
+def test_shared_directory_keeps_counters_of_dead_workers(tmp_path):
+    dead = worker_registry(3, 2)
+    dead.share(str(tmp_path))
+    dead.flush()
+    (path,) = tmp_path.iterdir()
+    path.rename(tmp_path / "worker-1.json")
+    mark_process_dead(str(tmp_path), 1)
+
+    live = worker_registry(4, 5)
+    live.share(str(tmp_path))
+    text = live.render()
+    assert 'finker_requests_total{route="/",status="200"} 7' in text
+    assert 'worker="1"' not in text
+    assert text.count("finker_db_pool_size{") == 1
@@ -0,0 +1,30 @@
+# Plans des requêtes critiques sur un PostgreSQL local migré (ignoré sans DATABASE_URL)
+#
+#   DATABASE_URL=postgresql://localhost/finker_test python -m pytest tests
+import os
+
+import pytest
+
+from migrate import QUERY_PLAN_CHECKS, apply_migrations, check_query_plans
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+pytestmark = pytest.mark.skipif(not os.getenv("DATABASE_URL"), reason="DATABASE_URL is not set")
+
+
+@pytest.fixture(scope="module")
+def plan_results():
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        apply_migrations(conn)
+        yield {result["name"]: result for result in check_query_plans(conn)}
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("name", [name for name, _, _ in QUERY_PLAN_CHECKS])
+def test_query_uses_expected_index(plan_results, name):
+    result = plan_results[name]
+    assert not result["seq_scan"], f"{name}: Seq Scan in plan"
+    assert set(result["used"]) & set(result["expected"]), \
+        f"{name}: expected one of {result['expected']}, used {result['used'] or 'no index'}"
@@ -0,0 +1,33 @@
+# Normalisation des prompts : les formulations proches partagent une clé, les questions différentes non
+import pytest
+
+from response_cache import ResponseCache, normalize_prompt
+
+
+@pytest.mark.parametrize("a, b", [
+    ("C'est quoi le machine learning ?", "c'est quoi le  Machine Learning"),
+    ("Qu'est-ce qu'une matrice ?", "qu'est-ce qu'une matrice?"),
+    ("Définis l'entropie.", "definis l'entropie"),
+    ("Explique   les\tgraphes !", "explique les graphes"),
+])
+def test_close_prompts_share_a_key(a, b):
+    assert normalize_prompt(a) == normalize_prompt(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("C++", "C"),
+    ("C#", "C"),
+    ("C++", "C#"),
+    ("2+2", "2-2"),
+    ("2*3", "2/3"),
+    ("a < b", "a = b"),
+    ("x-1", "x 1"),
+])
+def test_symbols_are_kept(a, b):
+    assert normalize_prompt(a) != normalize_prompt(b)
+
+
+def test_key_for_distinguishes_symbols():
+    cache = ResponseCache()
+    keys = {cache.key_for(prompt, [], None, "gemini", "system") for prompt in ("C++ ?", "C# ?", "C ?")}
+    assert len(keys) == 3
@@ -0,0 +1,181 @@
+# Export / import des conversations d'un utilisateur en NDJSON, en flux (mémoire constante)
+import csv
+import io
+import json
+from datetime import datetime
+
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor, execute_values
+
+EXPORT_FORMAT_VERSION = 1
+
+# Lignes lues par aller-retour du curseur serveur, messages par lot à l'import
+EXPORT_FETCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+ROLES = ("user", "assistant")
+
+
+class ImportFormatError(ValueError):
+    """Ligne NDJSON invalide (numéro de ligne dans le message)"""
+
+    def __init__(self, line_number, message):
+        super().__init__(f"line {line_number}: {message}")
+        self.line_number = line_number
+
+
+def _timestamp(record, field, line_number):
+    """Horodatage ISO 8601 optionnel d'une ligne (datetime ou None), sinon ImportFormatError"""
+    value = record.get(field)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ImportFormatError(line_number, f"{field} must be an ISO 8601 timestamp")
+
+
+def _record_id(value, line_number, field):
+    """Identifiant de conversation du fichier : entier ou chaîne (clé de correspondance vers le nouvel id)"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ImportFormatError(line_number, f"{field} must be an integer or a string")
+    return value
+
+
+def _ndjson(record):
+    return json.dumps(record, default=str, ensure_ascii=False) + "\n"
+
+
+def export_conversations(get_db, user_id):
+    """Générateur de lignes NDJSON : une ligne `conversation` suivie de ses lignes `message`, par id croissant
+
+    Curseur côté serveur : les lignes arrivent par paquets de EXPORT_FETCH_SIZE, la mémoire
+    du worker ne dépend pas de la taille de l'historique.
+    """
+    yield _ndjson({"type": "export", "version": EXPORT_FORMAT_VERSION})
+    with get_db() as conn:
+        cursor = conn.cursor(name="export_conversations", cursor_factory=RealDictCursor)
+        cursor.itersize = EXPORT_FETCH_SIZE
+        cursor.execute(
+            """SELECT c.id AS conversation_id, c.title, c.created_at AS conversation_created_at, c.updated_at,
+                      h.id, h.role, h.content, h.created_at
+               FROM public.conversations c
+               LEFT JOIN public.conversations_history h ON h.conversation_id = c.id
+               WHERE c.user_id = %s
+               ORDER BY c.id, h.id""",
+            (user_id,)
+        )
+        current = None
+        for row in cursor:
+            if row["conversation_id"] != current:
+                current = row["conversation_id"]
+                yield _ndjson({
+                    "type": "conversation",
+                    "id": current,
+                    "title": row["title"],
+                    "created_at": row["conversation_created_at"],
+                    "updated_at": row["updated_at"],
+                })
+            if row["id"] is not None:
+                yield _ndjson({
+                    "type": "message",
+                    "conversation_id": current,
+                    "role": row["role"],
+                    "content": row["content"],
+                    "created_at": row["created_at"],
+                })
+        cursor.close()
+
+
+def _copy_messages(cursor, rows):
+    """COPY ... FROM STDIN (le plus rapide), ou INSERT multi-lignes quand psycogreen est actif
+    (COPY n'est pas disponible avec un wait callback, c.-à-d. sous les workers gevent)"""
+    if extensions.get_wait_callback() is not None:
+        execute_values(
+            cursor,
+            "INSERT INTO public.conversations_history (conversation_id, user_id, role, content, created_at) VALUES %s",
+            rows,
+            page_size=IMPORT_BATCH_SIZE,
+        )
+        return
+    buffer = io.StringIO()
+    # Champs tous entre guillemets : pour COPY, un champ vide sans guillemets vaut NULL
+    csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        """COPY public.conversations_history (conversation_id, user_id, role, content, created_at)
+           FROM STDIN WITH (FORMAT csv)""",
+        buffer
+    )
+
+
+def import_conversations(get_db, user_id, lines):
+    """Importer des lignes NDJSON (format de l'export) pour `user_id`, dans une seule transaction
+
+    Les conversations reçoivent de nouveaux ids ; les messages sont insérés par lots de
+    IMPORT_BATCH_SIZE. Retourne {"conversations": n, "messages": n} ; lève ImportFormatError
+    (rien n'est importé) sur la première ligne invalide.
+    """
+    conversation_ids = {}  # id dans le fichier -> nouvel id
+    batch = []
+    messages = 0
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT LOCALTIMESTAMP")
+        now = cursor.fetchone()[0]
+        for line_number, line in enumerate(lines, start=1):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ImportFormatError(line_number, f"invalid JSON ({str(e)})")
+            if not isinstance(record, dict):
+                raise ImportFormatError(line_number, "expected a JSON object")
+            kind = record.get("type")
+
+            if kind == "export":
+                if record.get("version") != EXPORT_FORMAT_VERSION:
+                    raise ImportFormatError(line_number, f"unsupported export version {record.get('version')}")
+            elif kind == "conversation":
+                if "id" not in record:
+                    raise ImportFormatError(line_number, "conversation without id")
+                file_id = _record_id(record["id"], line_number, "id")
+                title = str(record.get("title") or "Nouvelle conversation")[:500]
+                if "\x00" in title:
+                    raise ImportFormatError(line_number, "title contains a NUL character")
+                created_at = _timestamp(record, "created_at", line_number)
+                updated_at = _timestamp(record, "updated_at", line_number)
+                cursor.execute(
+                    """INSERT INTO public.conversations (user_id, title, created_at, updated_at)
+                       VALUES (%s, %s, COALESCE(%s::timestamp, CURRENT_TIMESTAMP), COALESCE(%s::timestamp, CURRENT_TIMESTAMP))
+                       RETURNING id""",
+                    (user_id, title, created_at, updated_at)
+                )
+                conversation_ids[file_id] = cursor.fetchone()[0]
+            elif kind == "message":
+                conversation_id = conversation_ids.get(
+                    _record_id(record.get("conversation_id"), line_number, "conversation_id"))
+                if conversation_id is None:
+                    raise ImportFormatError(line_number, "message before its conversation line")
+                if record.get("role") not in ROLES or not isinstance(record.get("content"), str):
+                    raise ImportFormatError(line_number, "message needs a role (user|assistant) and a text content")
+                # PostgreSQL refuse U+0000 dans un TEXT : l'erreur arriverait au COPY, sans numéro de ligne
+                if "\x00" in record["content"]:
+                    raise ImportFormatError(line_number, "content contains a NUL character")
+                batch.append((conversation_id, user_id, record["role"], record["content"],
+                              _timestamp(record, "created_at", line_number) or now))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    _copy_messages(cursor, batch)
+                    messages += len(batch)
+                    batch = []
+            else:
+                raise ImportFormatError(line_number, f"unknown line type {kind!r}")
+
+        if batch:
+            _copy_messages(cursor, batch)
+            messages += len(batch)
+        cursor.close()
+    return {"conversations": len(conversation_ids), "messages": messages}